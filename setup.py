@@ -50,4 +50,7 @@ setup(
     install_requires=[
         'cryptojwt',
     ],
+    extras_require={
+        'async': ['aiosmtplib>=2'],
+    },
 )
@@ -1,4 +1,8 @@
 from django.contrib import admin
+from django.db.models.functions import Upper
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _
 
 from cms.contexts.admin import AbstractCreatedModifiedBy
 from cms.publications.models import PublicationContext
@@ -11,14 +15,71 @@ from . models import *
 
 @admin.register(Newsletter)
 class NewsletterAdmin(AbstractCreatedModifiedBy):
-    list_display = ('name', 'site', 'is_active')
+    list_display = ('name', 'site', 'is_active',
+                    'subscribers_count', 'test_subscribers_count')
     search_fields = ('name', 'description')
     list_filter = ('site', 'created', 'modified')
-    inlines = (NewsletterTestSubscriptionAdminInline,
-               NewsletterSubscriptionAdminInline)
-    readonly_fields = ('created_by', 'modified_by')
+    # the subscriptions have their own paginated changelists,
+    # an inline would render all of them
+    readonly_fields = ('created_by', 'modified_by',
+                       'subscriptions', 'test_subscriptions')
     prepopulated_fields = {'slug': ('name',)}
 
+    def get_subscriptions_link(self, obj, model, count):
+        if not obj.pk: return '-'
+        url = reverse(f'admin:unicms_newsletter_{model._meta.model_name}_changelist')
+        return format_html('{} - <a href="{}?newsletter__id__exact={}">{}</a>',
+                           count, url, obj.pk, _('show all'))
+
+    @admin.display(description=_('Subscribers'))
+    def subscriptions(self, obj):
+        return self.get_subscriptions_link(obj, NewsletterSubscription,
+                                           obj.subscribers_count)
+
+    @admin.display(description=_('Test subscribers'))
+    def test_subscriptions(self, obj):
+        return self.get_subscriptions_link(obj, NewsletterTestSubscription,
+                                           obj.test_subscribers_count)
+
+
+@admin.register(NewsletterSubscription)
+class NewsletterSubscriptionAdmin(AbstractCreatedModifiedBy):
+    list_display = ('email', 'first_name', 'last_name', 'newsletter',
+                    'status', 'date_subscription', 'date_unsubscription')
+    list_filter = ('status', 'newsletter', 'html', 'date_subscription')
+    list_select_related = ('newsletter',)
+    list_per_page = 100
+    # no COUNT(*) of the whole table on every filtered page
+    show_full_result_count = False
+    # istartswith, UPPER(email) LIKE 'TERM%', on the UPPER(email) index
+    search_fields = ('^email',)
+    autocomplete_fields = ('newsletter',)
+    readonly_fields = ('created_by', 'modified_by', 'status')
+
+    def get_search_results(self, request, queryset, search_term):
+        # a whole address is looked up with an equality on the same index
+        search_term = search_term.strip()
+        if '@' in search_term and ' ' not in search_term:
+            queryset = queryset.annotate(email_upper=Upper('email'))\
+                               .filter(email_upper=search_term.upper())
+            return queryset, False
+        return super().get_search_results(request, queryset, search_term)
+
+    def delete_queryset(self, request, queryset):
+        # the bulk delete of the action does not call delete(),
+        # that updates the counts
+        newsletters = set(queryset.values_list('newsletter', flat=True))
+        super().delete_queryset(request, queryset)
+        queryset.model.recount_newsletters(newsletters)
+
+
+@admin.register(NewsletterTestSubscription)
+class NewsletterTestSubscriptionAdmin(NewsletterSubscriptionAdmin):
+    list_display = ('email', 'first_name', 'last_name',
+                    'newsletter', 'is_active')
+    list_filter = ('is_active', 'newsletter', 'html')
+    readonly_fields = ('created_by', 'modified_by')
+
 
 @admin.register(Message)
 class MessageAdmin(AbstractPreviewableAdmin):
@@ -37,8 +98,9 @@ class MessageAdmin(AbstractPreviewableAdmin):
     search_fields = ('name',)
     list_filter = ('newsletter__name', 'created', 'modified', 'is_active')
     readonly_fields = ('created_by', 'modified_by',
-                       'queued', 'sending',
-                       'queued_test', 'sending_test')
+                       'queued', 'sending', 'sending_expires',
+                       'queued_test', 'sending_test', 'sending_test_expires',
+                       'next_run_at')
 
     class Media:
         js = ("js/ckeditor5/ckeditor.js",
@@ -52,3 +114,19 @@ class MessagePublicationAdmin(AbstractCreatedModifiedBy):
     list_display = ('publication', 'webpath', 'is_active', 'date_start', 'date_end',)
     search_fields = ('publication__name', 'publication__title', 'webpath__fullpath')
     list_filter = ('webpath__site',)
+
+
+@admin.register(MessageDelivery)
+class MessageDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('email', 'sending', 'status', 'attempts', 'date_sent')
+    # a row for each recipient of each sending,
+    # no COUNT(*) of the whole table on every filtered page
+    show_full_result_count = False
+    search_fields = ('email',)
+    list_filter = ('status', 'date_sent')
+    raw_id_fields = ('sending', 'subscriber')
+    readonly_fields = ('sending', 'subscriber', 'email', 'status',
+                       'attempts', 'last_error', 'date_sent')
+
+    def has_add_permission(self, request, obj=None):
+        return False
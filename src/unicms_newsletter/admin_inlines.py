@@ -3,22 +3,6 @@ from django.contrib import admin
 from . models import *
 
 
-class NewsletterTestSubscriptionAdminInline(admin.TabularInline):
-    model = NewsletterTestSubscription
-    extra = 0
-    classes = ['collapse']
-    list_display = ('first_name', 'last_name', 'email', 'is_active')
-    search_fields = ('first_name', 'last_name', 'email')
-
-
-class NewsletterSubscriptionAdminInline(admin.TabularInline):
-    model = NewsletterSubscription
-    extra = 0
-    classes = ['collapse']
-    list_display = ('first_name', 'last_name', 'email', 'is_active')
-    search_fields = ('first_name', 'last_name', 'email')
-
-
 class MessageAdminInline(admin.TabularInline):
     model = Message
     extra = 0
@@ -83,7 +67,8 @@ class MessageSendingAdminInline(admin.TabularInline):
     model = MessageSending
     extra = 0
     classes = ['collapse']
-    readonly_fields = ('date', 'html_file', 'recipients')
+    readonly_fields = ('date', 'html_file', 'recipients',
+                       'success', 'failed', 'completed')
 
     def has_add_permission(self, request, obj=None):
         return False
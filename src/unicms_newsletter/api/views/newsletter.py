@@ -1,14 +1,17 @@
 import logging
 
 from django.contrib.contenttypes.models import ContentType
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.decorators import method_decorator
+from django.utils.translation import gettext_lazy as _
 
 # from cms.contexts.decorators import detect_language
 
-from rest_framework import generics
+from rest_framework import exceptions, generics
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.schemas.openapi import AutoSchema
@@ -21,7 +24,9 @@ from cms.api.views.generics import UniCMSCachedRetrieveUpdateDestroyAPIView, Uni
 from cms.api.views.logs import ObjectLogEntriesList
 
 from .. permissions import NewsletterGetCreatePermissions
+from ... exports import EXPORT_CONTENT_TYPES, EXPORT_FORMATS, export_rows, get_export_queryset
 from ... forms import *
+from ... imports import IMPORT_FORMATS, SubscriptionImporter, get_import_format, read_rows
 from ... models import *
 from ... serializers import *
 # from ... utils import calendar_context_base_filter
@@ -94,7 +99,8 @@ class NewsletterSubscriptionList(UniCMSListCreateAPIView):
     description = ""
     search_fields = ['email', 'last_name']
     filterset_fields = ['is_active', 'email', 'last_name', 'html',
-                        'date_unsubscription', 'date_subscription']
+                        'date_unsubscription', 'date_subscription',
+                        'status']
     serializer_class = NewsletterSubscriptionSerializer
 
     def get_queryset(self):
@@ -173,6 +179,82 @@ class NewsletterSubscriptionView(UniCMSCachedRetrieveUpdateDestroyAPIView):
         return super().delete(request, *args, **kwargs)
 
 
+class NewsletterSubscriptionImportView(APIView):
+    """
+    Bulk import of subscribers from a CSV (with a header)
+    or JSONL file: email, first_name, last_name, html.
+    Returns a report instead of the subscriptions
+    """
+    description = ""
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        newsletter = get_object_or_404(Newsletter,
+                                       pk=self.kwargs['newsletter_id'])
+        permission = check_user_permission_on_object(request.user,
+                                                     newsletter)
+        if not permission['granted']:
+            raise LoggedPermissionDenied(classname=self.__class__.__name__,
+                                         resource=request.method)
+        upload = request.FILES.get('file')
+        if not upload:
+            # ValidationError here is the django one, from the models
+            raise exceptions.ValidationError(_("'file' param must be passed"))
+        file_format = request.data.get('format') or get_import_format(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            raise exceptions.ValidationError(_("'format' param must be csv or jsonl"))
+        importer = SubscriptionImporter(newsletter=newsletter,
+                                        user=request.user)
+        # the uploaded file is read line by line
+        report = importer.run(read_rows(upload, file_format))
+        return Response(report)
+
+
+class NewsletterSubscriptionExportView(APIView):
+    """
+    Streaming CSV or JSONL export of the subscribers.
+    Query params: file_format (csv, jsonl), status,
+    date_from and date_to (YYYY-MM-DD, date of subscription)
+    """
+    description = ""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        newsletter = get_object_or_404(Newsletter,
+                                       pk=self.kwargs['newsletter_id'])
+        permission = check_user_permission_on_object(request.user,
+                                                     newsletter)
+        if not permission['granted']:
+            raise LoggedPermissionDenied(classname=self.__class__.__name__,
+                                         resource=request.method)
+        # 'format' is taken by the rest_framework renderers
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            raise exceptions.ValidationError(_("'file_format' param must be csv or jsonl"))
+        dates = {}
+        for param in ('date_from', 'date_to'):
+            value = request.query_params.get(param)
+            if not value: continue
+            try:
+                dates[param] = parse_date(value)
+            except ValueError:
+                dates[param] = None
+            if not dates[param]:
+                raise exceptions.ValidationError(_("Dates must be YYYY-MM-DD"))
+        try:
+            subscriptions = get_export_queryset(newsletter=newsletter,
+                                                status=request.query_params.get('status'),
+                                                **dates)
+        except ValueError as e:
+            raise exceptions.ValidationError(str(e))
+        response = StreamingHttpResponse(export_rows(subscriptions, file_format),
+                                         content_type=EXPORT_CONTENT_TYPES[file_format])
+        file_name = f'{newsletter.slug}-subscribers.{file_format}'
+        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+        return response
+
+
 class NewsletterSubscriptionFormView(APIView):
 
     def get(self, *args, **kwargs):
@@ -0,0 +1,405 @@
+import asyncio
+import itertools
+import logging
+import queue
+import threading
+import time
+
+from email.utils import formatdate
+
+from django.conf import settings
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail.message import make_msgid, sanitize_address
+from django.core.mail.utils import DNS_NAME
+from django.utils.module_loading import import_string
+
+from . settings import *
+from . throttling import get_rate_limiter
+
+
+logger = logging.getLogger(__name__)
+
+
+NEWSLETTER_SEND_EMAIL_CHUNK = getattr(settings, 'NEWSLETTER_SEND_EMAIL_CHUNK',
+                                      NEWSLETTER_SEND_EMAIL_CHUNK)
+NEWSLETTER_SEND_EMAIL_RECONNECT = getattr(settings, 'NEWSLETTER_SEND_EMAIL_RECONNECT',
+                                          NEWSLETTER_SEND_EMAIL_RECONNECT)
+NEWSLETTER_DELIVERY_ENGINE = getattr(settings, 'NEWSLETTER_DELIVERY_ENGINE',
+                                     NEWSLETTER_DELIVERY_ENGINE)
+NEWSLETTER_DELIVERY_WORKERS = getattr(settings, 'NEWSLETTER_DELIVERY_WORKERS',
+                                      NEWSLETTER_DELIVERY_WORKERS)
+NEWSLETTER_DELIVERY_MAX_WORKERS = getattr(settings, 'NEWSLETTER_DELIVERY_MAX_WORKERS',
+                                          NEWSLETTER_DELIVERY_MAX_WORKERS)
+
+
+def chunks(iterable, size):
+    """
+    Yields lists of at most `size` items from `iterable`
+    without materializing it
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk: return
+        yield chunk
+
+
+def get_delivery_engine():
+    return import_string(NEWSLETTER_DELIVERY_ENGINE)
+
+
+class PreparedEmail(object):
+    """
+    An email whose body and attachments are MIME-encoded only once.
+    Every recipient gets a lightweight copy that stamps
+    its own To, Date and Message-ID headers on the cached payload
+    """
+
+    stamped_headers = ('To', 'Cc', 'Date', 'Message-ID')
+
+    def __init__(self, email):
+        self.email = email
+        self.encoding = email.encoding or settings.DEFAULT_CHARSET
+        self.message = email.message()
+        for header in self.stamped_headers:
+            del self.message[header]
+        self.payloads = {}
+        self.lock = threading.Lock()
+
+    def as_bytes(self, linesep='\n'):
+        if linesep not in self.payloads:
+            with self.lock:
+                if linesep not in self.payloads:
+                    self.payloads[linesep] = self.message.as_bytes(linesep=linesep)
+        return self.payloads[linesep]
+
+    def for_recipient(self, recipient):
+        return RecipientEmailMessage(self, recipient)
+
+
+class StampedMessage(object):
+    """
+    The MIME message of a single recipient,
+    the subset of email.message.Message used by the mail backends
+    """
+
+    def __init__(self, prepared, headers):
+        self.prepared = prepared
+        self.headers = headers
+
+    def __getitem__(self, name):
+        return dict(self.headers).get(name, self.prepared.message[name])
+
+    def get_charset(self):
+        return self.prepared.message.get_charset()
+
+    def as_bytes(self, unixfrom=False, linesep='\n'):
+        headers = ''.join(f'{name}: {value}{linesep}'
+                          for name, value in self.headers)
+        return headers.encode('ascii') + self.prepared.as_bytes(linesep=linesep)
+
+    def as_string(self, unixfrom=False, linesep='\n'):
+        return self.as_bytes(linesep=linesep).decode(self.prepared.encoding)
+
+
+class RecipientEmailMessage(mail.EmailMessage):
+    """
+    EmailMessage for a single recipient of a PreparedEmail,
+    body and attachments are shared, not copied
+    """
+
+    def __init__(self, prepared, recipient):
+        super().__init__(subject=prepared.email.subject,
+                         from_email=prepared.email.from_email,
+                         to=[recipient])
+        self.prepared = prepared
+        self.body = prepared.email.body
+        self.attachments = prepared.email.attachments
+        self.content_subtype = prepared.email.content_subtype
+        self.encoding = prepared.email.encoding
+
+    def message(self):
+        encoding = self.prepared.encoding
+        headers = [('To', ', '.join(sanitize_address(addr, encoding)
+                                    for addr in self.to)),
+                   ('Date', formatdate(localtime=settings.EMAIL_USE_LOCALTIME)),
+                   ('Message-ID', make_msgid(domain=DNS_NAME))]
+        return StampedMessage(self.prepared, headers)
+
+
+class DeliveryReport(object):
+    """
+    Outcome of a delivery: number of sent emails
+    and failed recipients with the related error.
+    `on_result(recipient, error)` is called for every email,
+    possibly from a worker thread or from the event loop
+    """
+
+    def __init__(self, on_result=None):
+        self.sent = 0
+        self.failed = {}
+        self.on_result = on_result
+
+    def add_sent(self, recipient):
+        self.sent += 1
+        if self.on_result: self.on_result(recipient, None)
+
+    def add_failed(self, recipient, error):
+        self.failed[recipient] = error
+        if self.on_result: self.on_result(recipient, error)
+
+    def update(self, report):
+        self.sent += report.sent
+        self.failed.update(report.failed)
+
+    def __str__(self):
+        return f'{self.sent} sent, {len(self.failed)} failed'
+
+
+class SequentialDelivery(object):
+    """
+    Sends emails over a single backend connection, in chunks.
+    The connection is reopened every `reconnect_every` messages
+    and after every failure
+    """
+
+    def __init__(self, label='',
+                 chunk_size=NEWSLETTER_SEND_EMAIL_CHUNK,
+                 reconnect_every=NEWSLETTER_SEND_EMAIL_RECONNECT,
+                 rate_limiter=None):
+        self.label = label
+        self.chunk_size = max(chunk_size or 1, 1)
+        self.reconnect_every = reconnect_every
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.sent_from_connection = 0
+
+    def open_connection(self, connection=None):
+        connection = connection or mail.get_connection()
+        self.sent_from_connection = 0
+        try:
+            connection.open()
+        except Exception as e:
+            # the backend will try again to connect on the next message
+            logger.debug(f'[{self.label}] exception {e} while opening connection')
+        return connection
+
+    def reconnect(self, connection):
+        try:
+            connection.close()
+        except Exception as e:
+            logger.debug(f'[{self.label}] exception {e} while closing connection')
+        return self.open_connection(connection)
+
+    def get_delay(self):
+        if not self.rate_limiter: return 0
+        return self.rate_limiter.reserve()
+
+    def throttle(self):
+        delay = self.get_delay()
+        if delay > 0:
+            logger.debug(f'Start sleeping {self.label} - {delay:.2f}s')
+            time.sleep(delay)
+            logger.debug(f'End sleeping {self.label}')
+
+    def send_chunk(self, connection, chunk, report):
+        for position, email in enumerate(chunk):
+            recipient = ', '.join(email.to)
+            try:
+                self.throttle()
+            except Exception as e:
+                # the rest of the chunk is not going to be sent
+                for unsent in chunk[position:]:
+                    report.add_failed(', '.join(unsent.to), str(e))
+                raise
+            try:
+                logger.debug(f'Try to send newsletter {self.label} email to {recipient}')
+                if not connection.send_messages([email]):
+                    raise Exception('message refused by the backend')
+                report.add_sent(recipient)
+                self.sent_from_connection += 1
+                logger.debug(f'Sent newsletter {self.label} email to {recipient}')
+            except Exception as e:
+                report.add_failed(recipient, str(e))
+                logger.debug(f'Newsletter {self.label} exception {e} while sending to {recipient}')
+                connection = self.reconnect(connection)
+        return connection
+
+    def deliver(self, emails, on_result=None, report=None):
+        # the report can be passed by the caller,
+        # to keep the results if the delivery is interrupted
+        if report is None:
+            report = DeliveryReport(on_result=on_result)
+        connection = self.open_connection()
+        for number, chunk in enumerate(chunks(emails, self.chunk_size), start=1):
+            start = time.monotonic()
+            connection = self.send_chunk(connection, chunk, report)
+            elapsed = time.monotonic() - start
+            logger.info(f'[{self.label}] chunk {number}: {len(chunk)} emails '
+                        f'in {elapsed:.2f}s ({len(chunk) / (elapsed or 1e-6):.1f} emails/s)')
+            if self.reconnect_every and self.sent_from_connection >= self.reconnect_every:
+                connection = self.reconnect(connection)
+        connection.close()
+        return report
+
+
+class ThreadedDelivery(SequentialDelivery):
+    """
+    Sends emails over a bounded pool of threads.
+    The emails stream is split in chunks that workers take in turn,
+    each worker owns its connection and all share the same rate limiter
+    """
+
+    def __init__(self, label='', workers=NEWSLETTER_DELIVERY_WORKERS,
+                 rate_limiter=None, **kwargs):
+        super().__init__(label=label, rate_limiter=rate_limiter, **kwargs)
+        self.kwargs = kwargs
+        self.workers = max(min(workers, NEWSLETTER_DELIVERY_MAX_WORKERS), 1)
+        self.lock = threading.Lock()
+
+    def get_worker(self, number):
+        return SequentialDelivery(label=f'{self.label} #{number}',
+                                  rate_limiter=self.rate_limiter,
+                                  **self.kwargs)
+
+    @staticmethod
+    def consume(shards):
+        while True:
+            chunk = shards.get()
+            if chunk is None: return
+            yield from chunk
+
+    def run_worker(self, number, shards, report):
+        # results of this worker, also those before an exception
+        worker_report = DeliveryReport(on_result=report.on_result)
+        emails = self.consume(shards)
+        try:
+            self.get_worker(number).deliver(emails, report=worker_report)
+        except Exception as e:
+            logger.error(f'[{self.label}] worker {number} exception {e}')
+            # keep on draining, the producer must never be blocked
+            for email in emails:
+                worker_report.add_failed(', '.join(email.to), str(e))
+        with self.lock:
+            report.update(worker_report)
+
+    def deliver(self, emails, on_result=None):
+        report = DeliveryReport(on_result=on_result)
+        shards = queue.Queue(maxsize=self.workers * 2)
+        threads = [threading.Thread(target=self.run_worker,
+                                    args=(number, shards, report))
+                   for number in range(1, self.workers + 1)]
+        for thread in threads:
+            thread.start()
+        try:
+            for chunk in chunks(emails, self.chunk_size):
+                shards.put(chunk)
+        finally:
+            for thread in threads:
+                shards.put(None)
+            for thread in threads:
+                thread.join()
+        return report
+
+
+class AsyncDelivery(SequentialDelivery):
+    """
+    Sends emails from a single event loop over `sessions` concurrent
+    SMTP sessions (aiosmtplib), each one reused for many messages.
+    Database reads happen between the chunks, never while the loop runs.
+    It only speaks SMTP: with another EMAIL_BACKEND (console, locmem,
+    file...) the emails are delivered sequentially through the backend
+    """
+    smtp_backend = 'django.core.mail.backends.smtp.EmailBackend'
+
+    def __init__(self, label='', sessions=NEWSLETTER_DELIVERY_WORKERS, **kwargs):
+        super().__init__(label=label, **kwargs)
+        self.sessions = max(min(sessions, NEWSLETTER_DELIVERY_MAX_WORKERS), 1)
+
+    def get_client(self):
+        try:
+            import aiosmtplib
+        except ImportError: # pragma: no cover
+            raise ImproperlyConfigured('AsyncDelivery requires aiosmtplib>=2, '
+                                       'pip install unicms-newsletter[async]')
+        return aiosmtplib.SMTP(hostname=settings.EMAIL_HOST,
+                               port=settings.EMAIL_PORT,
+                               username=settings.EMAIL_HOST_USER or None,
+                               password=settings.EMAIL_HOST_PASSWORD or None,
+                               use_tls=settings.EMAIL_USE_SSL,
+                               start_tls=settings.EMAIL_USE_TLS,
+                               timeout=settings.EMAIL_TIMEOUT)
+
+    async def close_client(self, client):
+        try:
+            if client.is_connected:
+                await client.quit()
+        except Exception as e:
+            logger.debug(f'[{self.label}] exception {e} while closing session')
+            client.close()
+
+    async def send_email(self, session, email):
+        client = session['client']
+        if not client.is_connected:
+            await client.connect()
+            session['sent'] = 0
+        encoding = email.encoding or settings.DEFAULT_CHARSET
+        await client.sendmail(sanitize_address(email.from_email, encoding),
+                              [sanitize_address(addr, encoding)
+                               for addr in email.recipients()],
+                              email.message().as_bytes(linesep='\r\n'))
+        session['sent'] += 1
+
+    async def run_session(self, session, emails, report):
+        while emails:
+            email = emails.pop()
+            recipient = ', '.join(email.to)
+            # the limiter may lock a file, not on the event loop
+            delay = 0
+            if self.rate_limiter:
+                loop = asyncio.get_running_loop()
+                delay = await loop.run_in_executor(None, self.get_delay)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.send_email(session, email)
+                report.add_sent(recipient)
+            except Exception as e:
+                report.add_failed(recipient, str(e))
+                logger.debug(f'Newsletter {self.label} exception {e} while sending to {recipient}')
+                await self.close_client(session['client'])
+                continue
+            if self.reconnect_every and session['sent'] >= self.reconnect_every:
+                await self.close_client(session['client'])
+
+    async def close_sessions(self, sessions):
+        await asyncio.gather(*[self.close_client(session['client'])
+                               for session in sessions])
+
+    async def send_chunk_async(self, sessions, chunk, report):
+        # sessions share the chunk, last in first out
+        emails = list(reversed(chunk))
+        await asyncio.gather(*[self.run_session(session, emails, report)
+                               for session in sessions])
+
+    def deliver(self, emails, on_result=None, report=None):
+        if settings.EMAIL_BACKEND != self.smtp_backend:
+            logger.warning(f'[{self.label}] AsyncDelivery requires the SMTP backend, '
+                           f'sending through {settings.EMAIL_BACKEND}')
+            return super().deliver(emails, on_result=on_result, report=report)
+        if report is None:
+            report = DeliveryReport(on_result=on_result)
+        loop = asyncio.new_event_loop()
+        sessions = [{'client': self.get_client(), 'sent': 0}
+                    for i in range(self.sessions)]
+        try:
+            for number, chunk in enumerate(chunks(emails, self.chunk_size), start=1):
+                start = time.monotonic()
+                loop.run_until_complete(self.send_chunk_async(sessions, chunk, report))
+                elapsed = time.monotonic() - start
+                logger.info(f'[{self.label}] chunk {number}: {len(chunk)} emails '
+                            f'in {elapsed:.2f}s ({len(chunk) / (elapsed or 1e-6):.1f} emails/s)')
+        finally:
+            loop.run_until_complete(self.close_sessions(sessions))
+            loop.close()
+        return report
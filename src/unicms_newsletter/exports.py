@@ -0,0 +1,71 @@
+import csv
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from . models import NewsletterSubscription, SUBSCRIPTION_STATUSES
+from . settings import *
+
+
+NEWSLETTER_EXPORT_BATCH = getattr(settings, 'NEWSLETTER_EXPORT_BATCH',
+                                  NEWSLETTER_EXPORT_BATCH)
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv',
+                        'jsonl': 'application/x-ndjson'}
+# the first columns can be imported again, see imports.py
+EXPORT_FIELDS = ('email', 'first_name', 'last_name', 'html',
+                 'status', 'date_subscription', 'date_unsubscription')
+
+
+def get_export_queryset(newsletter, status=None,
+                        date_from=None, date_to=None):
+    """
+    Subscriptions of a newsletter, by status
+    and by date of subscription (dates included)
+    """
+    if status and status not in dict(SUBSCRIPTION_STATUSES):
+        raise ValueError(f'Invalid status: {status}')
+    subscriptions = NewsletterSubscription.objects.filter(newsletter=newsletter)
+    if status:
+        subscriptions = subscriptions.filter(status=status)
+    # the column is compared with aware datetimes of the current timezone
+    if date_from:
+        start = datetime.datetime.combine(date_from, datetime.time.min)
+        subscriptions = subscriptions.filter(date_subscription__gte=timezone.make_aware(start))
+    if date_to:
+        end = datetime.datetime.combine(date_to + datetime.timedelta(days=1),
+                                        datetime.time.min)
+        subscriptions = subscriptions.filter(date_subscription__lt=timezone.make_aware(end))
+    return subscriptions.order_by('pk')
+
+
+class Echo(object):
+    """
+    A file-like object that returns what it is written,
+    so that csv.writer builds one line at a time
+    """
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, file_format='csv', batch_size=NEWSLETTER_EXPORT_BATCH):
+    """
+    Yields the subscriptions of `queryset` as CSV (with a header)
+    or JSONL lines, fetching `batch_size` rows at a time
+    """
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=batch_size)
+    if file_format == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(EXPORT_FIELDS, row)),
+                             cls=DjangoJSONEncoder) + '\n'
+        return
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([value.isoformat()
+                               if isinstance(value, datetime.datetime)
+                               else value for value in row])
@@ -156,7 +156,8 @@ class NewsletterMessageViewHandler(BaseContentHandler):
         permission = check_user_permission_on_object(self.request.user,
                                                      self.newsletter)
         if permission['granted']:
-            return HttpResponse(self.message.prepare_html())
+            html_text, plain_text = self.message.prepare_content()
+            return HttpResponse(html_text)
         return HttpResponseForbidden('Permission denied')
 
 
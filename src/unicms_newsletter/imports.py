@@ -0,0 +1,245 @@
+import codecs
+import csv
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+from . delivery import chunks
+from . models import NewsletterSubscription, SUBSCRIPTION_SUBSCRIBED
+from . settings import *
+
+
+logger = logging.getLogger(__name__)
+
+
+NEWSLETTER_IMPORT_BATCH = getattr(settings, 'NEWSLETTER_IMPORT_BATCH',
+                                  NEWSLETTER_IMPORT_BATCH)
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+def get_import_format(file_name):
+    if file_name.lower().endswith(('.jsonl', '.json')): return 'jsonl'
+    return 'csv'
+
+
+def decode_lines(stream, position, errors):
+    """
+    Decodes a binary stream one line at a time:
+    undecodable lines are skipped and added to `errors`,
+    `position['line']` is the number of the last line read
+    """
+    for number, line in enumerate(stream, start=1):
+        position['line'] = number
+        if number == 1 and line.startswith(codecs.BOM_UTF8):
+            line = line[len(codecs.BOM_UTF8):]
+        try:
+            yield line.decode('utf-8')
+        except UnicodeDecodeError as e:
+            errors.append((number, e))
+
+
+def read_rows(stream, file_format='csv'):
+    """
+    Yields (line number, row) from a binary CSV (with a header)
+    or JSONL stream, one line at a time.
+    Unreadable rows are yielded as the exception that describes them,
+    so that the import goes on with the next ones
+    """
+    position = {'line': 0}
+    errors = []
+    lines = decode_lines(stream, position, errors)
+    if file_format == 'jsonl':
+        for line in lines:
+            yield from errors
+            del errors[:]
+            if not line.strip(): continue
+            try:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError('a JSON object is expected')
+            except ValueError as e:
+                row = e
+            yield position['line'], row
+        yield from errors
+        return
+    reader = csv.DictReader(lines)
+    try:
+        reader.fieldnames
+    except csv.Error as e:
+        yield position['line'], e
+        return
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            row = e
+        yield from errors
+        del errors[:]
+        yield position['line'], row
+    yield from errors
+
+
+def parse_bool(value):
+    if isinstance(value, bool): return value
+    return str(value).strip().lower() not in ('', '0', 'false', 'no', 'n', 'off')
+
+
+class SubscriptionImporter(object):
+    """
+    Imports the subscribers of a newsletter in batches:
+    rows are validated and normalized, repeated emails are skipped
+    and existing subscriptions only get their data updated
+    """
+    # optional columns, copied to the existing subscriptions too
+    fields = ('first_name', 'last_name', 'html')
+    # errors listed in the report
+    max_errors = 100
+
+    def __init__(self, newsletter, user=None,
+                 batch_size=NEWSLETTER_IMPORT_BATCH):
+        self.newsletter = newsletter
+        self.user = user
+        self.batch_size = batch_size
+        # emails already read (lowercase), to skip the repeated ones
+        self.emails = set()
+        self.report = {'rows': 0,
+                       'created': 0,
+                       'updated': 0,
+                       'unchanged': 0,
+                       'duplicated': 0,
+                       'invalid': 0,
+                       'errors': []}
+
+    def add_error(self, line, error):
+        self.report['invalid'] += 1
+        if len(self.report['errors']) < self.max_errors:
+            self.report['errors'].append({'line': line, 'error': error})
+
+    def clean(self, line, row):
+        if isinstance(row, Exception):
+            self.add_error(line, f'invalid row: {row}')
+            return
+        email = str(row.get('email') or '').strip()
+        # the domain part of an email is case insensitive
+        local, at, domain = email.rpartition('@')
+        if at: email = f'{local}@{domain.lower()}'
+        try:
+            validate_email(email)
+            # EmailField max_length
+            if len(email) > 254: raise ValidationError(email)
+        except ValidationError:
+            self.add_error(line, f'invalid email: {email}')
+            return
+        # the same address, whatever the case
+        if email.lower() in self.emails:
+            self.report['duplicated'] += 1
+            return
+        data = {'email': email}
+        for field in self.fields:
+            if field not in row: continue
+            value = row[field]
+            if field == 'html':
+                data[field] = parse_bool(value)
+                continue
+            value = str(value or '').strip()
+            if len(value) > 255:
+                self.add_error(line, f'{field} too long')
+                return
+            data[field] = value
+        self.emails.add(email.lower())
+        return data
+
+    def get_existing(self, rows):
+        """
+        Subscriptions of the rows already in the newsletter,
+        compared case-insensitively: {email: pk}
+        """
+        subscriptions = NewsletterSubscription.objects\
+                                              .filter(newsletter=self.newsletter)\
+                                              .annotate(email_upper=Upper('email'))\
+                                              .filter(email_upper__in=[row['email'].upper()
+                                                                       for row in rows])\
+                                              .values_list('email', 'pk')
+        existing = {email.lower(): (email, pk) for email, pk in subscriptions}
+        for row in rows:
+            # the stored address, as the unique constraint matches it
+            email, pk = existing.get(row['email'].lower(), (row['email'], None))
+            row['email'] = email
+        return dict(existing.values())
+
+    def write(self, rows):
+        existing = self.get_existing(rows)
+        # only the columns of every row, the others are left as they are
+        update_fields = [field for field in self.fields
+                         if all(field in row for row in rows)]
+        now = timezone.now()
+        subscriptions = []
+        for row in rows:
+            subscription = NewsletterSubscription(newsletter=self.newsletter,
+                                                  is_active=True,
+                                                  date_subscription=now,
+                                                  # bulk_create does not call save()
+                                                  status=SUBSCRIPTION_SUBSCRIBED,
+                                                  created_by=self.user,
+                                                  modified_by=self.user,
+                                                  **row)
+            subscriptions.append(subscription)
+
+        if not update_fields:
+            NewsletterSubscription.objects\
+                                  .bulk_create([subscription for subscription in subscriptions
+                                                if subscription.email not in existing],
+                                               ignore_conflicts=True)
+        elif getattr(connection.features, 'supports_update_conflicts_with_target', False):
+            # a single upsert, Django 4.1+
+            NewsletterSubscription.objects\
+                                  .bulk_create(subscriptions,
+                                               update_conflicts=True,
+                                               unique_fields=['newsletter', 'email'],
+                                               update_fields=update_fields + ['modified_by'])
+        else: # pragma: no cover
+            NewsletterSubscription.objects\
+                                  .bulk_create([subscription for subscription in subscriptions
+                                                if subscription.email not in existing],
+                                               ignore_conflicts=True)
+            updated = []
+            for subscription in subscriptions:
+                if subscription.email not in existing: continue
+                subscription.pk = existing[subscription.email]
+                updated.append(subscription)
+            NewsletterSubscription.objects\
+                                  .bulk_update(updated,
+                                               update_fields + ['modified_by'])
+
+        self.report['created'] += len(rows) - len(existing)
+        if update_fields:
+            self.report['updated'] += len(existing)
+        else:
+            self.report['unchanged'] += len(existing)
+
+    def run(self, rows):
+        """
+        Imports the (line number, row) items and returns the report
+        """
+        for batch in chunks(rows, self.batch_size):
+            self.report['rows'] += len(batch)
+            cleaned = [row for row in (self.clean(line, row) for line, row in batch)
+                       if row]
+            if not cleaned: continue
+            with transaction.atomic():
+                self.write(cleaned)
+        self.report['subscribers'] = self.newsletter.update_subscribers_count()
+        logger.info(f'[{self.newsletter}] subscribers import: '
+                    f'{self.report["created"]} created, '
+                    f'{self.report["updated"]} updated, '
+                    f'{self.report["invalid"]} invalid')
+        return self.report
@@ -1,15 +1,43 @@
 import json
+import os
 
 from cryptojwt.jwk.rsa import import_private_rsa_key_from_file, RSAKey
+from cryptojwt.jwe.exception import DecryptionFailed
 from cryptojwt.jwe.jwe import factory
 from cryptojwt.jwe.jwe_rsa import JWE_RSA
 from django.conf import settings
 
 
-RSA_KEY = settings.JWE_RSA_KEY_PATH
 JWE_ALG = settings.JWE_ALG
 JWE_ENC = settings.JWE_ENC
 
+# parsed RSA keys, by file path: (file mtime, RSAKey)
+_rsa_keys = {}
+
+
+def get_rsa_key(path):
+    """
+    Returns the RSAKey of a private key file,
+    parsed once per process and again only if the file changes
+    """
+    mtime = os.stat(path).st_mtime_ns
+    cached = _rsa_keys.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    key = RSAKey(priv_key=import_private_rsa_key_from_file(path))
+    _rsa_keys[path] = (mtime, key)
+    return key
+
+
+def get_decryption_keys():
+    """
+    The current key and the old ones, still valid for decryption
+    after a key rotation (settings.JWE_RSA_OLD_KEY_PATHS)
+    """
+    paths = [settings.JWE_RSA_KEY_PATH]
+    paths.extend(getattr(settings, 'JWE_RSA_OLD_KEY_PATHS', []))
+    return [get_rsa_key(path) for path in paths]
+
 
 def encrypt_to_jwe(content):
     """Returns a string
@@ -23,8 +51,8 @@ def encrypt_to_jwe(content):
     if not isinstance(content, bytes):
         raise Exception('encrypt_to_jwe content must be a bytes object')
 
-    priv_key = import_private_rsa_key_from_file(RSA_KEY)
-    pub_key = priv_key.public_key()
+    # only the current key encrypts
+    pub_key = get_rsa_key(settings.JWE_RSA_KEY_PATH).pub_key
     _rsa = JWE_RSA(content, alg=JWE_ALG, enc=JWE_ENC)
     jwe = _rsa.encrypt(pub_key)
     return jwe
@@ -32,12 +60,17 @@ def encrypt_to_jwe(content):
 
 def decrypt_from_jwe(jwe):
     # RSA_KEY = settings.UNITICKET_JWT_RSA_KEY_PATH
-    RSA_KEY = settings.JWE_RSA_KEY_PATH
     JWE_ALG = settings.JWE_ALG
     JWE_ENC = settings.JWE_ENC
 
-    priv_key = import_private_rsa_key_from_file(RSA_KEY)
     _decryptor = factory(jwe, alg=JWE_ALG, enc=JWE_ENC)
-    _dkey = RSAKey(priv_key=priv_key)
-    msg = _decryptor.decrypt(jwe, [_dkey])
+    keys = get_decryption_keys()
+    # a wrong RSA key raises ValueError, not DecryptionFailed,
+    # so the keys are tried one by one
+    for _dkey in keys[:-1]:
+        try:
+            return _decryptor.decrypt(jwe, [_dkey])
+        except (ValueError, DecryptionFailed):
+            continue
+    msg = _decryptor.decrypt(jwe, keys[-1:])
     return msg
@@ -0,0 +1,383 @@
+import datetime
+import json
+import os
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from cms.contexts.models import WebPath, WebSite
+from cms.publications.models import Category, Publication, PublicationContext
+
+from unicms_calendar.models import Calendar, CalendarContext, CalendarEvent, Event
+
+from ... import delivery, jwts, models, tokens
+from ... models import (Message,
+                        MessageCalendarContext,
+                        MessagePublicationCategory,
+                        MessageSending,
+                        MessageWebpath,
+                        Newsletter,
+                        NewsletterSubscription)
+
+
+# sample sites for the message benchmarks
+MESSAGE_SIZES = {
+    'small': {'categories': 5, 'webpaths': 2, 'news': 100,
+              'events': 10, 'subscribers': 100},
+    'medium': {'categories': 20, 'webpaths': 5, 'news': 1000,
+               'events': 100, 'subscribers': 1000},
+    'large': {'categories': 50, 'webpaths': 10, 'news': 10000,
+              'events': 500, 'subscribers': 10000},
+}
+
+
+def confirm():
+    """
+    Ask user to enter Y or N (case-insensitive).
+    :return: True if the answer is Y.
+    :rtype: bool
+    """
+    answer = ""
+    while answer not in ["y", "n"]:
+        answer = input("OK to push to continue [Y/N]? ").lower()
+    return answer == "y"
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('uniCMS newsletter benchmarks, '
+            'on sample data created in a transaction rolled back at the end')
+
+    def add_arguments(self, parser):
+        parser.epilog = ('Example: ./manage.py unicms_newsletter_benchmark '
+                         '--subscribers 100000 --news 1000 '
+                         '--message small medium --tokens 200 --json results.json')
+        parser.add_argument('-y', required=False, action="store_true",
+                            help="run the benchmarks")
+        parser.add_argument('--subscribers', required=False, type=int,
+                            default=100000,
+                            help="sample subscribers (default: 100000, 0: skip)")
+        parser.add_argument('--news', required=False, type=int,
+                            default=1000,
+                            help="sample news, in 10 categories: the command fails "
+                                 "if the queries that select them depend on "
+                                 "the categories (default: 1000, 0: skip)")
+        parser.add_argument('--message', required=False, nargs='*',
+                            choices=MESSAGE_SIZES.keys(),
+                            default=['small', 'medium'],
+                            help="sample sites on which a message is prepared, "
+                                 "rendered and sent, without the send rate "
+                                 "limits (default: small medium)")
+        parser.add_argument('--tokens', required=False, type=int,
+                            default=200,
+                            help="subscription tokens encoded and decoded "
+                                 "by every codec (default: 200, 0: skip)")
+        parser.add_argument('--smtp', required=False, default='',
+                            help="HOST:PORT of a local SMTP sink, "
+                                 "e.g. python -m aiosmtpd -n -l localhost:1025 "
+                                 "(default: the locmem email backend)")
+        parser.add_argument('--json', required=False, default='',
+                            help="write the results in a JSON file ('-': stdout)")
+
+    def measure(self, benchmark, name, function):
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                result = function()
+                elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.results.append({'benchmark': benchmark,
+                             'name': name,
+                             'queries': len(queries),
+                             'seconds': round(elapsed, 4),
+                             'peak_memory_kb': peak // 1024,
+                             'result': result})
+        return len(queries)
+
+    def print_table(self):
+        columns = ('benchmark', 'name', 'queries',
+                   'seconds', 'peak_memory_kb', 'result')
+        rows = [columns] + [[str(result[column]) for column in columns]
+                            for result in self.results]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+        for number, row in enumerate(rows):
+            print('  '.join(value.ljust(width)
+                            for value, width in zip(row, widths)))
+            if not number:
+                print('  '.join('-' * width for width in widths))
+
+    def write_json(self, path, options):
+        results = {'date': timezone.localtime().isoformat(),
+                   'database': connection.vendor,
+                   'options': {'subscribers': options['subscribers'],
+                               'news': options['news'],
+                               'tokens': options['tokens'],
+                               'message': {size: MESSAGE_SIZES[size]
+                                           for size in options['message']},
+                               'smtp': options['smtp']},
+                   'results': self.results}
+        if path == '-':
+            print(json.dumps(results, indent=2))
+            return
+        with open(path, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+    def create_site(self, name):
+        return WebSite.objects.create(name=f'benchmark {name}',
+                                      domain=f'{name}.benchmark.example.org',
+                                      is_active=True)
+
+    def create_subscribers(self, newsletter, number):
+        now = timezone.now()
+        day = datetime.timedelta(days=1)
+        subscriptions = []
+        for i in range(number):
+            # one in ten unsubscribed, one in ten subscribed again
+            date_unsubscription = None
+            if i % 10 == 1: date_unsubscription = now - day
+            elif i % 10 == 2: date_unsubscription = now - day * 3
+            subscription = NewsletterSubscription(newsletter=newsletter,
+                                                  email=f'subscriber{i}@example.org',
+                                                  is_active=True,
+                                                  date_subscription=now - day * 2,
+                                                  date_unsubscription=date_unsubscription)
+            # bulk_create does not call save()
+            subscription.status = subscription.get_status()
+            subscriptions.append(subscription)
+        NewsletterSubscription.objects.bulk_create(subscriptions,
+                                                   batch_size=1000)
+        newsletter.update_subscribers_count()
+
+    def benchmark_subscribers(self, number):
+        site = self.create_site('subscribers')
+        newsletter = Newsletter.objects.create(name='benchmark',
+                                               slug='benchmark',
+                                               site=site,
+                                               is_active=True)
+        self.create_subscribers(newsletter, number)
+        benchmark = f'subscribers ({number})'
+        self.measure(benchmark, 'get_valid_subscribers().count()',
+                     lambda: newsletter.get_valid_subscribers().count())
+        self.measure(benchmark, 'iter_subscribers()',
+                     lambda: sum(1 for i in newsletter.iter_subscribers()))
+
+    def create_categories(self, prefix, number):
+        return [Category.objects.create(name=f'{prefix} {i}',
+                                        description=f'{prefix} {i}')
+                for i in range(number)]
+
+    def create_webpaths(self, site, prefix, number):
+        return [WebPath.objects.create(site=site,
+                                       name=f'{prefix} {i}',
+                                       path=f'{prefix}-{i}',
+                                       is_active=True)
+                for i in range(number)]
+
+    def create_publication(self, prefix, number, categories):
+        publication = Publication.objects.create(name=f'{prefix} {number}',
+                                                 title=f'{prefix} {number}',
+                                                 slug=f'{prefix}-{number}',
+                                                 is_active=True)
+        publication.category.add(categories[number % len(categories)])
+        return publication
+
+    def create_news(self, webpaths, categories, number):
+        now = timezone.localtime()
+        for i in range(number):
+            publication = self.create_publication('news', i, categories)
+            PublicationContext.objects.create(publication=publication,
+                                              webpath=webpaths[i % len(webpaths)],
+                                              is_active=True,
+                                              date_start=now - datetime.timedelta(minutes=i+1),
+                                              date_end=now + datetime.timedelta(days=1),
+                                              order=i)
+
+    def create_events(self, webpath, categories, number):
+        now = timezone.localtime()
+        calendar = Calendar.objects.create(name='benchmark', is_active=True)
+        calendar_context = CalendarContext.objects.create(calendar=calendar,
+                                                          webpath=webpath,
+                                                          is_active=True)
+        for i in range(number):
+            publication = self.create_publication('event', i, categories)
+            event = Event.objects.create(publication=publication,
+                                         date_start=now + datetime.timedelta(hours=i),
+                                         date_end=now + datetime.timedelta(hours=i+1))
+            CalendarEvent.objects.create(calendar=calendar,
+                                         event=event,
+                                         is_active=True)
+        return calendar_context
+
+    def benchmark_news(self, number):
+        site = self.create_site('news')
+        webpaths = self.create_webpaths(site, 'news', 1)
+        categories = self.create_categories('news', 10)
+        self.create_news(webpaths, categories, number)
+        newsletter = Newsletter.objects.create(name='benchmark news',
+                                               slug='benchmark-news',
+                                               site=site,
+                                               is_active=True)
+        message = Message.objects.create(name='benchmark',
+                                         newsletter=newsletter,
+                                         is_active=True)
+        MessageWebpath.objects.create(message=message, webpath=webpaths[0],
+                                      is_active=True)
+        for category in categories:
+            MessagePublicationCategory.objects.create(message=message,
+                                                      category=category,
+                                                      is_active=True)
+
+        def count_news():
+            data = message.prepare_data()
+            return sum(len(news) for news in data['webpath_news'].values())
+
+        benchmark = f'news ({number})'
+        selections = MessagePublicationCategory.objects.filter(message=message)
+        window_functions = models.NEWSLETTER_WINDOW_FUNCTIONS
+        queries = {}
+        try:
+            for selected in (1, len(categories)):
+                selections.update(is_active=False)
+                selections.filter(category__in=categories[:selected])\
+                          .update(is_active=True)
+                for window in (True, False):
+                    models.NEWSLETTER_WINDOW_FUNCTIONS = window
+                    name = (f'prepare_data() {selected} categories, '
+                            f'{"window functions" if window else "python"}')
+                    queries[name] = self.measure(benchmark, name, count_news)
+        finally:
+            models.NEWSLETTER_WINDOW_FUNCTIONS = window_functions
+        # a constant number of queries, whatever the categories
+        # and the way their top news are selected
+        if len(set(queries.values())) > 1:
+            self.failures.append(f'news: the queries depend on the categories: {queries}')
+
+    def benchmark_message(self, size):
+        sizes = MESSAGE_SIZES[size]
+        site = self.create_site(size)
+        webpaths = self.create_webpaths(site, size, sizes['webpaths'])
+        categories = self.create_categories(size, sizes['categories'])
+        self.create_news(webpaths, categories, sizes['news'])
+        calendar_context = self.create_events(webpaths[0], categories,
+                                              sizes['events'])
+        newsletter = Newsletter.objects.create(name=f'benchmark {size}',
+                                               slug=f'benchmark-{size}',
+                                               site=site,
+                                               is_active=True)
+        self.create_subscribers(newsletter, sizes['subscribers'])
+        message = Message.objects.create(name=f'benchmark {size}',
+                                         newsletter=newsletter,
+                                         intro_text='benchmark',
+                                         is_active=True)
+        for webpath in webpaths:
+            MessageWebpath.objects.create(message=message, webpath=webpath,
+                                          is_active=True)
+        MessageCalendarContext.objects.create(message=message,
+                                              calendar_context=calendar_context,
+                                              is_active=True)
+
+        benchmark = (f'message {size} ({sizes["categories"]} categories, '
+                     f'{sizes["news"]} news, {sizes["events"]} events)')
+        data = {}
+
+        def prepare_data():
+            data.update(message.prepare_data())
+            return sum(len(news) for news in data['webpath_news'].values())
+
+        def send():
+            # the configured send rate would only measure its sleeps
+            # (the deprecated defaults allow 2 emails per second)
+            get_rate_limiter = delivery.get_rate_limiter
+            try:
+                delivery.get_rate_limiter = lambda: None
+                message.send()
+            finally:
+                delivery.get_rate_limiter = get_rate_limiter
+            sending = MessageSending.objects.filter(message=message).first()
+            # the html file is not removed by the rollback
+            os.remove(f'{settings.MEDIA_ROOT}/{sending.html_file}')
+            return f'{sending.success} sent, {sending.failed} failed'
+
+        self.measure(benchmark, 'prepare_data()', prepare_data)
+        self.measure(benchmark, 'check_data()',
+                     lambda: bool(message.check_data()))
+        self.measure(benchmark, 'prepare_html()',
+                     lambda: f'{len(message.prepare_html(data=data))} chars')
+        self.measure(benchmark, 'send()', send)
+
+    def benchmark_tokens(self, number):
+        data = {'first_name': 'benchmark',
+                'last_name': 'benchmark',
+                'email': 'subscriber@example.org',
+                'html': True,
+                'newsletter': 1,
+                'timestamp': timezone.now().timestamp()}
+
+        def confirm_tokens(codec, clear_keys=False):
+            start = time.perf_counter()
+            for i in range(number):
+                if clear_keys: jwts._rsa_keys.clear()
+                token = codec.encode(data)
+                if clear_keys: jwts._rsa_keys.clear()
+                codec.decode(token)
+            # a subscription request and its confirmation
+            return (f'{number / (time.perf_counter() - start):.1f} requests/s, '
+                    f'{len(token)} chars')
+
+        benchmark = f'tokens ({number})'
+        if getattr(settings, 'JWE_RSA_KEY_PATH', ''):
+            self.measure(benchmark, 'JWETokenCodec no key cache',
+                         lambda: confirm_tokens(tokens.JWETokenCodec(),
+                                                clear_keys=True))
+            self.measure(benchmark, 'JWETokenCodec',
+                         lambda: confirm_tokens(tokens.JWETokenCodec()))
+        self.measure(benchmark, 'SignedTokenCodec',
+                     lambda: confirm_tokens(tokens.SignedTokenCodec()))
+
+    def get_email_settings(self, smtp):
+        if not smtp:
+            return {'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend'}
+        host, port = smtp.rsplit(':', 1)
+        return {'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+                'EMAIL_HOST': host,
+                'EMAIL_PORT': int(port),
+                'EMAIL_HOST_USER': '',
+                'EMAIL_HOST_PASSWORD': '',
+                'EMAIL_USE_TLS': False,
+                'EMAIL_USE_SSL': False}
+
+    def handle(self, *args, **options):
+        if options['y'] or confirm():
+            self.results = []
+            # query count regressions, the command exits with an error
+            self.failures = []
+            try:
+                with transaction.atomic(), \
+                     override_settings(**self.get_email_settings(options['smtp'])):
+                    if options['subscribers']:
+                        self.benchmark_subscribers(options['subscribers'])
+                    if options['news']:
+                        self.benchmark_news(options['news'])
+                    for size in options['message']:
+                        self.benchmark_message(size)
+                    if options['tokens']:
+                        self.benchmark_tokens(options['tokens'])
+                    raise Rollback()
+            except Rollback:
+                pass
+            self.print_table()
+            if options['json']:
+                self.write_json(options['json'], options)
+            if self.failures:
+                raise CommandError('\n'.join(self.failures))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from ... models import Newsletter
+
+
+def confirm():
+    """
+    Ask user to enter Y or N (case-insensitive).
+    :return: True if the answer is Y.
+    :rtype: bool
+    """
+    answer = ""
+    while answer not in ["y", "n"]:
+        answer = input("OK to push to continue [Y/N]? ").lower()
+    return answer == "y"
+
+
+class Command(BaseCommand):
+    help = 'uniCMS newsletter rebuild the subscribers counts'
+
+    def add_arguments(self, parser):
+        parser.epilog = 'Example: ./manage.py unicms_newsletter_count_subscribers'
+        parser.add_argument('-y', required=False, action="store_true",
+                            help="rebuild the subscribers counts")
+
+    def handle(self, *args, **options):
+        if options['y'] or confirm():
+            for newsletter in Newsletter.objects.all():
+                count = newsletter.update_subscribers_count()
+                test_count = newsletter.update_subscribers_count(test=True)
+                print(f'[{newsletter}] - {count} subscribers, {test_count} test subscribers')
@@ -0,0 +1,63 @@
+import argparse
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from ... exports import (EXPORT_FORMATS,
+                         NEWSLETTER_EXPORT_BATCH,
+                         export_rows,
+                         get_export_queryset)
+from ... models import Newsletter, SUBSCRIPTION_STATUSES
+
+
+def date(value):
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if not parsed:
+        raise argparse.ArgumentTypeError(f'{value} is not a valid date (YYYY-MM-DD)')
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'uniCMS newsletter streaming export of subscribers to a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.epilog = ('Example: ./manage.py unicms_newsletter_export_subscribers 1 '
+                         'subscribers.csv --status subscribed')
+        parser.add_argument('newsletter', type=int,
+                            help="newsletter id")
+        parser.add_argument('file', nargs='?', default='-',
+                            help="output file, standard output if omitted")
+        parser.add_argument('--format', required=False, choices=EXPORT_FORMATS,
+                            default='csv', help="file format")
+        parser.add_argument('--status', required=False,
+                            choices=dict(SUBSCRIPTION_STATUSES).keys(),
+                            help="only the subscriptions with this status")
+        parser.add_argument('--date-from', required=False, type=date,
+                            help="subscribed from this date (YYYY-MM-DD)")
+        parser.add_argument('--date-to', required=False, type=date,
+                            help="subscribed until this date (YYYY-MM-DD)")
+        parser.add_argument('--batch', required=False, type=int,
+                            default=NEWSLETTER_EXPORT_BATCH,
+                            help="subscriptions fetched at a time")
+
+    def handle(self, *args, **options):
+        newsletter = Newsletter.objects.filter(pk=options['newsletter']).first()
+        if not newsletter:
+            raise CommandError(f'Newsletter {options["newsletter"]} does not exist')
+        subscriptions = get_export_queryset(newsletter=newsletter,
+                                            status=options['status'],
+                                            date_from=options['date_from'],
+                                            date_to=options['date_to'])
+        rows = export_rows(subscriptions,
+                           file_format=options['format'],
+                           batch_size=options['batch'])
+        if options['file'] == '-':
+            sys.stdout.writelines(rows)
+            return
+        with open(options['file'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(rows)
+        print(f'[{newsletter}] - Subscribers exported to {options["file"]}')
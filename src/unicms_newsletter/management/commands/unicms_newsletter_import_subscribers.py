@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ... imports import (IMPORT_FORMATS,
+                         NEWSLETTER_IMPORT_BATCH,
+                         SubscriptionImporter,
+                         get_import_format,
+                         read_rows)
+from ... models import Newsletter
+
+
+def confirm():
+    """
+    Ask user to enter Y or N (case-insensitive).
+    :return: True if the answer is Y.
+    :rtype: bool
+    """
+    answer = ""
+    while answer not in ["y", "n"]:
+        answer = input("OK to push to continue [Y/N]? ").lower()
+    return answer == "y"
+
+
+class Command(BaseCommand):
+    help = 'uniCMS newsletter bulk import of subscribers from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.epilog = 'Example: ./manage.py unicms_newsletter_import_subscribers 1 subscribers.csv'
+        parser.add_argument('newsletter', type=int,
+                            help="newsletter id")
+        parser.add_argument('file',
+                            help="CSV (with a header) or JSONL file: "
+                                 "email, first_name, last_name, html")
+        parser.add_argument('--format', required=False, choices=IMPORT_FORMATS,
+                            help="file format, from the file extension if omitted")
+        parser.add_argument('--batch', required=False, type=int,
+                            default=NEWSLETTER_IMPORT_BATCH,
+                            help="subscriptions written in a single transaction")
+        parser.add_argument('-y', required=False, action="store_true",
+                            help="import the subscribers")
+
+    def handle(self, *args, **options):
+        newsletter = Newsletter.objects.filter(pk=options['newsletter']).first()
+        if not newsletter:
+            raise CommandError(f'Newsletter {options["newsletter"]} does not exist')
+        file_format = options['format'] or get_import_format(options['file'])
+        if options['y'] or confirm():
+            importer = SubscriptionImporter(newsletter=newsletter,
+                                            batch_size=options['batch'])
+            with open(options['file'], 'rb') as stream:
+                report = importer.run(read_rows(stream, file_format))
+            print(f'[{newsletter}] - {report["rows"]} rows: '
+                  f'{report["created"]} created, '
+                  f'{report["updated"]} updated, '
+                  f'{report["unchanged"]} unchanged, '
+                  f'{report["duplicated"]} duplicated, '
+                  f'{report["invalid"]} invalid')
+            for error in report['errors']:
+                print(f'[{newsletter}] - line {error["line"]}: {error["error"]}')
+            print(f'[{newsletter}] - {report["subscribers"]} subscribers')
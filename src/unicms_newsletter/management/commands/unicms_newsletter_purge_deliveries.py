@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from ... models import MessageDelivery, NEWSLETTER_DELIVERY_RETENTION
+
+
+def confirm():
+    """
+    Ask user to enter Y or N (case-insensitive).
+    :return: True if the answer is Y.
+    :rtype: bool
+    """
+    answer = ""
+    while answer not in ["y", "n"]:
+        answer = input("OK to push to continue [Y/N]? ").lower()
+    return answer == "y"
+
+
+class Command(BaseCommand):
+    help = 'uniCMS newsletter delete the deliveries of the old completed sendings'
+
+    def add_arguments(self, parser):
+        # e.g. once a day
+        parser.epilog = 'Example: ./manage.py unicms_newsletter_purge_deliveries [--days 90]'
+        parser.add_argument('-y', required=False, action="store_true",
+                            help="delete the old deliveries")
+        parser.add_argument('--days', required=False, type=int,
+                            default=NEWSLETTER_DELIVERY_RETENTION,
+                            help="age of the sendings, in days "
+                                 f"(default: {NEWSLETTER_DELIVERY_RETENTION})")
+
+    def handle(self, *args, **options):
+        if not options['days']:
+            print('Deliveries are kept forever (NEWSLETTER_DELIVERY_RETENTION = 0)')
+            return
+        if options['y'] or confirm():
+            deleted = MessageDelivery.purge(days=options['days'])
+            print(f'{deleted} deliveries older than {options["days"]} days deleted')
@@ -1,10 +1,15 @@
+import multiprocessing
 import os
 import shutil
 
+from concurrent.futures import ProcessPoolExecutor
+
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
 
-from ... models import Message
+from ... models import Message, MessageSending
+from ... throttling import get_buckets, get_rate_file
 
 
 def confirm():
@@ -19,26 +24,98 @@ def confirm():
     return answer == "y"
 
 
+def send_message(pk):
+    """
+    Sends a ready message, in the command or in a worker process
+    """
+    message = Message.objects.select_related('newsletter').get(pk=pk)
+    # data and content are built once, for the check and the sending
+    plan = message.get_sending_plan()
+    # an interrupted sending is finished with its own content
+    if not message.get_unfinished_sending() and plan.is_empty():
+        print(f'[{message.newsletter}] - {message.name} is empty')
+        return
+    print(f'[{message.newsletter}] - Sending message {message.name}')
+    try:
+        message.send(plan=plan)
+    except Exception as e:
+        # the sending failed or the message is taken by another process
+        print(f'[{message.newsletter}] - {message.name}: {e}')
+        return
+    print(f'[{message.newsletter}] - Sent message {message.name}')
+
+
 class Command(BaseCommand):
     help = 'uniCMS newsletter send all ready messages'
 
     def add_arguments(self, parser):
-        parser.epilog = 'Example: ./manage.py unicms_newsletter_send'
+        # it can run every minute, the messages are sent when due
+        parser.epilog = 'Example: ./manage.py unicms_newsletter_send [--resume] [--workers 4]'
         parser.add_argument('-y', required=False, action="store_true",
                             help="send all ready messages")
+        parser.add_argument('--resume', required=False, action="store_true",
+                            help="resume the interrupted sendings "
+                                 "whose sending lease has expired")
+        parser.add_argument('--workers', required=False, type=int, default=1,
+                            help="processes sending the ready messages "
+                                 "in parallel (default: 1), forked: "
+                                 "every process has its own send rate "
+                                 "unless it is shared through a file, "
+                                 "see NEWSLETTER_SEND_RATE_FILE")
+
+    def resume(self):
+        sendings = MessageSending.objects\
+                                 .filter(completed=False,
+                                         message__newsletter__is_active=True)\
+                                 .select_related('message__newsletter')
+        for sending in sendings:
+            message = sending.message
+            print(f'[{message.newsletter}] - Resuming message {message.name} ({sending.date})')
+            try:
+                message.resume(sending)
+            except Exception as e:
+                # the sending failed or the message is taken by another process
+                print(f'[{message.newsletter}] - {message.name}: {e}')
+                continue
+            print(f'[{message.newsletter}] - Sent message {message.name}')
 
     def handle(self, *args, **options):
+        if options['resume']:
+            if options['y'] or confirm():
+                self.resume()
+            return
         if options['y'] or confirm():
-            messages = Message.objects.filter(newsletter__is_active=True)
-            for message in messages:
+            ready = []
+            # only the messages due by now are checked
+            for message in Message.get_due_messages():
                 if not message.is_ready():
                     print(f'[{message.newsletter}] - Message {message.name} is not ready')
+                    # e.g. the run at the chosen hour has been missed
+                    message.update_next_run()
                 else:
-                    data = message.check_data()
-                    if not data:
-                        print(f'[{message.newsletter}] - {message.name} is empty')
-                    else:
-                        print(f'[{message.newsletter}] - Sending message {message.name}')
-                        message.send(data=data)
-                        print(f'[{message.newsletter}] - Sent message {message.name}')
+                    ready.append(message.pk)
+
+            workers = min(options['workers'], len(ready))
+            # the workers inherit the loaded django apps,
+            # spawned processes would import the models before setup()
+            try:
+                context = multiprocessing.get_context('fork') if workers > 1 else None
+            except ValueError: # pragma: no cover
+                print('Processes can not be forked on this platform, '
+                      'the messages are sent one at a time')
+                context = None
+            if not context:
+                for pk in ready:
+                    send_message(pk)
+                return
+
+            if get_buckets() and not get_rate_file():
+                print(f'The send rate is enforced per process: {workers} workers '
+                      f'can send up to {workers} times the configured rate, '
+                      f'set NEWSLETTER_SEND_RATE_FILE to share it')
 
+            # forked workers must open their own database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=context) as executor:
+                list(executor.map(send_message, ready))
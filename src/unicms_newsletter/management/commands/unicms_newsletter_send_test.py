@@ -34,10 +34,10 @@ class Command(BaseCommand):
                 if not message.is_ready(test=True):
                     print(f'[{message.newsletter}] - Message {message.name} is not ready')
                 else:
-                    data = message.check_data(test=True)
-                    if not data:
+                    plan = message.get_sending_plan(test=True)
+                    if plan.is_empty():
                         print(f'[{message.newsletter}] - {message.name} is empty')
                     else:
                         print(f'[{message.newsletter}] - Sending message {message.name}')
-                        message.send(test=True, data=data)
+                        message.send(test=True, plan=plan)
                         print(f'[{message.newsletter}] - Sent message {message.name}')
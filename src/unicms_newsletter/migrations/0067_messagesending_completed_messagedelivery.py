@@ -0,0 +1,84 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        (
+            "unicms_newsletter",
+            "0066_alter_message_name_alter_message_template_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="messagesending",
+            name="completed",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.CreateModel(
+            name="MessageDelivery",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("modified", models.DateTimeField(auto_now=True)),
+                ("email", models.EmailField(max_length=254)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("sending", "Sending"),
+                            ("sent", "Sent"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("date_sent", models.DateTimeField(blank=True, null=True)),
+                (
+                    "sending",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="unicms_newsletter.messagesending",
+                    ),
+                ),
+                (
+                    "subscriber",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="unicms_newsletter.newslettersubscription",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Message deliveries",
+                "ordering": ["pk"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="messagedelivery",
+            index=models.Index(
+                fields=["sending", "status"], name="unicms_news_sending_70612c_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="messagedelivery",
+            unique_together={("sending", "email")},
+        ),
+    ]
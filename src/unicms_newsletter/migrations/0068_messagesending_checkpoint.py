@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("unicms_newsletter", "0067_messagesending_completed_messagedelivery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="messagesending",
+            name="failed",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="messagesending",
+            name="last_subscriber",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="messagesending",
+            name="success",
+            field=models.IntegerField(default=0),
+        ),
+    ]
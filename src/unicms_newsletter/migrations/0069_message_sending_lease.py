@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("unicms_newsletter", "0068_messagesending_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="sending_expires",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="sending_owner",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="sending_test_expires",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="sending_test_owner",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:38
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_status(apps, schema_editor):
+    NewsletterSubscription = apps.get_model(
+        "unicms_newsletter", "NewsletterSubscription"
+    )
+    NewsletterSubscription.objects.filter(is_active=False).update(status="disabled")
+    NewsletterSubscription.objects.filter(
+        is_active=True,
+        date_unsubscription__isnull=False,
+        date_subscription__lte=F("date_unsubscription"),
+    ).update(status="unsubscribed")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("unicms_newsletter", "0069_message_sending_lease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="newslettersubscription",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("subscribed", "Subscribed"),
+                    ("unsubscribed", "Unsubscribed"),
+                    ("disabled", "Disabled"),
+                ],
+                default="subscribed",
+                editable=False,
+                max_length=16,
+            ),
+        ),
+        migrations.RunPython(set_status, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="newslettersubscription",
+            index=models.Index(
+                fields=["newsletter", "status"], name="unicms_news_newslet_4b1b47_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+def count_subscribers(apps, schema_editor):
+    Newsletter = apps.get_model("unicms_newsletter", "Newsletter")
+    for newsletter in Newsletter.objects.all():
+        newsletter.subscribers_count = newsletter.newslettersubscription_set.filter(
+            status="subscribed"
+        ).count()
+        newsletter.test_subscribers_count = (
+            newsletter.newslettertestsubscription_set.filter(is_active=True).count()
+        )
+        newsletter.save(update_fields=["subscribers_count", "test_subscribers_count"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("unicms_newsletter", "0070_newslettersubscription_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="newsletter",
+            name="subscribers_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="newsletter",
+            name="test_subscribers_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_subscribers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:52
+
+import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def get_next_run(message, last_sending_date=None):
+    # frozen copy of unicms_newsletter.schedule.get_next_run
+    if not message.is_active:
+        return None
+    if not message.date_start or not message.date_end:
+        return None
+
+    now = timezone.localtime()
+    start = max(
+        timezone.localtime(message.date_start),
+        now.replace(minute=0, second=0, microsecond=0),
+    )
+    if last_sending_date:
+        last_sending_date = timezone.localtime(last_sending_date)
+        if message.repeat_each == 0:
+            return None
+        if message.repeat_each:
+            start = max(
+                start, last_sending_date + datetime.timedelta(message.repeat_each)
+            )
+        else:
+            start = max(
+                start,
+                last_sending_date.replace(minute=0, second=0, microsecond=0)
+                + datetime.timedelta(hours=1),
+            )
+
+    week_days = message.week_day.split(",") if message.week_day else []
+    next_run = start
+    for day in range(8):
+        if not week_days or str(next_run.weekday()) in week_days:
+            if message.hour is None or next_run.hour == message.hour:
+                break
+            if next_run.hour < message.hour:
+                next_run = next_run.replace(
+                    hour=message.hour, minute=0, second=0, microsecond=0
+                )
+                break
+        next_run = (next_run + datetime.timedelta(days=1)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+    else:
+        return None
+
+    if max(next_run, now) >= message.date_end:
+        return None
+    return next_run
+
+
+def set_next_run(apps, schema_editor):
+    Message = apps.get_model("unicms_newsletter", "Message")
+    MessageSending = apps.get_model("unicms_newsletter", "MessageSending")
+    for message in Message.objects.all():
+        last_sending = (
+            MessageSending.objects.filter(message=message).order_by("-date").first()
+        )
+        message.next_run_at = get_next_run(
+            message, last_sending_date=last_sending.date if last_sending else None
+        )
+        message.save(update_fields=["next_run_at"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("unicms_newsletter", "0071_newsletter_subscribers_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="next_run_at",
+            field=models.DateTimeField(
+                blank=True, db_index=True, editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(set_next_run, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:18
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("unicms_newsletter", "0072_message_next_run_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="newslettersubscription",
+            index=models.Index(
+                django.db.models.functions.text.Upper("email"),
+                name="unicms_news_email_upper_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="newslettertestsubscription",
+            index=models.Index(
+                django.db.models.functions.text.Upper("email"),
+                name="unicms_news_test_email_up_idx",
+            ),
+        ),
+    ]
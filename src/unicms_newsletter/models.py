@@ -1,17 +1,23 @@
 import calendar
+import contextlib
 import datetime
+import hashlib
 import logging
 import os
+import socket
 import sys
-import time
+import threading
+import uuid
 
 from django import template
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core import mail
 from django.core.validators import MaxValueValidator, MinValueValidator,validate_comma_separated_integer_list
-from django.db import models
-from django.db.models import Q
+from django.db import connection, models, transaction, DatabaseError, NotSupportedError
+from django.db.models import Count, Exists, F, Max, OrderBy, OuterRef, Q, Window
+from django.db.models.functions import Coalesce, Greatest, RowNumber, Upper
 from django.template.loader import get_template
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -31,6 +37,8 @@ from cms.templates.models import (ActivableModel,
 
 from unicms_calendar.models import *
 
+from . delivery import PreparedEmail, chunks, get_delivery_engine
+from . schedule import get_next_run
 from . settings import *
 
 
@@ -42,14 +50,22 @@ NEWSLETTER_MAX_ITEMS_IN_CATEGORY = getattr(settings, 'NEWSLETTER_MAX_ITEMS_IN_CA
                                            NEWSLETTER_MAX_ITEMS_IN_CATEGORY)
 NEWSLETTER_MAX_FREE_ITEMS = getattr(settings, 'NEWSLETTER_MAX_FREE_ITEMS',
                                     NEWSLETTER_MAX_FREE_ITEMS)
-NEWSLETTER_SEND_EMAIL_DELAY = getattr(settings, 'NEWSLETTER_SEND_EMAIL_DELAY',
-                                      NEWSLETTER_SEND_EMAIL_DELAY)
-NEWSLETTER_SEND_EMAIL_GROUP = getattr(settings, 'NEWSLETTER_SEND_EMAIL_GROUP',
-                                      NEWSLETTER_SEND_EMAIL_GROUP)
-NEWSLETTER_SEND_EMAIL_GROUP_DELAY = getattr(settings, 'NEWSLETTER_SEND_EMAIL_GROUP_DELAY',
-                                            NEWSLETTER_SEND_EMAIL_GROUP_DELAY)
+NEWSLETTER_WINDOW_FUNCTIONS = getattr(settings, 'NEWSLETTER_WINDOW_FUNCTIONS',
+                                      NEWSLETTER_WINDOW_FUNCTIONS)
 NEWSLETTER_MAX_ITEMS_FOR_MANUAL_SENDING = getattr(settings,'NEWSLETTER_MAX_ITEMS_FOR_MANUAL_SENDING',
                                                   NEWSLETTER_MAX_ITEMS_FOR_MANUAL_SENDING)
+NEWSLETTER_DELIVERY_QUEUE = getattr(settings, 'NEWSLETTER_DELIVERY_QUEUE',
+                                    NEWSLETTER_DELIVERY_QUEUE)
+NEWSLETTER_DELIVERY_BATCH = getattr(settings, 'NEWSLETTER_DELIVERY_BATCH',
+                                    NEWSLETTER_DELIVERY_BATCH)
+NEWSLETTER_DELIVERY_MAX_ATTEMPTS = getattr(settings, 'NEWSLETTER_DELIVERY_MAX_ATTEMPTS',
+                                           NEWSLETTER_DELIVERY_MAX_ATTEMPTS)
+NEWSLETTER_DELIVERY_RETENTION = getattr(settings, 'NEWSLETTER_DELIVERY_RETENTION',
+                                        NEWSLETTER_DELIVERY_RETENTION)
+NEWSLETTER_SENDING_LEASE = getattr(settings, 'NEWSLETTER_SENDING_LEASE',
+                                   NEWSLETTER_SENDING_LEASE)
+NEWSLETTER_CONTENT_CACHE_TIMEOUT = getattr(settings, 'NEWSLETTER_CONTENT_CACHE_TIMEOUT',
+                                           NEWSLETTER_CONTENT_CACHE_TIMEOUT)
 TOKEN_EXPIRATION = getattr(settings, 'TOKEN_EXPIRATION', TOKEN_EXPIRATION)
 
 CMS_NEWSLETTER_LIST_PREFIX_PATH =  getattr(settings, 'CMS_NEWSLETTER_VIEW_PREFIX_PATH',
@@ -92,6 +108,11 @@ class Newsletter(ActivableModel, TimeStampedModel, CreatedModifiedBy,
     sender_address = models.EmailField(blank=True, null=True)
     is_subscriptable = models.BooleanField(default=True)
     is_public = models.BooleanField(default=True)
+    # valid subscribers, updated when a subscription is saved or deleted
+    subscribers_count = models.PositiveIntegerField(default=0, editable=False)
+    test_subscribers_count = models.PositiveIntegerField(default=0, editable=False)
+
+    count_fields = ('subscribers_count', 'test_subscribers_count')
 
     class Meta:
         ordering = ['name']
@@ -99,21 +120,57 @@ class Newsletter(ActivableModel, TimeStampedModel, CreatedModifiedBy,
         verbose_name = _("Newsletter")
         verbose_name_plural = _("Newsletters")
 
+    def save(self, *args, **kwargs):
+        # the counts are only updated by the subscriptions,
+        # the in-memory values may be stale
+        if not self._state.adding and \
+           not kwargs.get('force_insert') and \
+           kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name
+                                       for field in self._meta.concrete_fields
+                                       if not field.primary_key and
+                                       field.name not in self.count_fields]
+        super(Newsletter, self).save(*args, **kwargs)
+
     def get_valid_subscribers(self, test=False):
         if test:
             return NewsletterTestSubscription.objects\
                                              .filter(newsletter=self,
                                                      is_active=True)
 
-        subscriptions = NewsletterSubscription.objects\
-                                              .filter(newsletter=self,
-                                                      is_active=True)
-        to_exclude = []
-        for subscription in subscriptions:
-            if not subscription.date_unsubscription: continue
-            if subscription.date_subscription <= subscription.date_unsubscription:
-                to_exclude.append(subscription.pk)
-        return subscriptions.exclude(pk__in=to_exclude)
+        return NewsletterSubscription.objects\
+                                     .filter(newsletter=self,
+                                             status=SUBSCRIPTION_SUBSCRIBED)
+
+    def get_subscribers_count(self, test=False):
+        if test: return self.test_subscribers_count
+        return self.subscribers_count
+
+    def update_subscribers_count(self, test=False):
+        """
+        Counts the subscribers again,
+        after bulk changes that don't go through save()
+        """
+        field = 'test_subscribers_count' if test else 'subscribers_count'
+        count = self.get_valid_subscribers(test=test).count()
+        Newsletter.objects.filter(pk=self.pk).update(**{field: count})
+        setattr(self, field, count)
+        return count
+
+    def iter_subscribers(self, test=False, after=0,
+                         size=NEWSLETTER_DELIVERY_BATCH):
+        """
+        Yields (pk, email) of the valid subscribers ordered by pk,
+        a page at a time (keyset pagination on pk)
+        """
+        subscribers = self.get_valid_subscribers(test=test)\
+                          .order_by('pk')\
+                          .values_list('pk', 'email')
+        while True:
+            page = list(subscribers.filter(pk__gt=after)[:size])
+            yield from page
+            if len(page) < size: return
+            after = page[-1][0]
 
     def serialize(self):
         return {'name': self.name,
@@ -131,11 +188,65 @@ class AbstractNewsletterSubscription(ActivableModel, CreatedModifiedBy):
     email = models.EmailField()
     html = models.BooleanField(default=True)
 
+    test = False
+    # fields of is_counted()
+    counted_fields = ('newsletter_id', 'is_active')
+
     class Meta:
         abstract = True
         ordering = ['last_name', 'first_name']
         unique_together = ('newsletter', 'email')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # loaded state, to update the newsletter counts only if it changes
+        # (unknown if the fields are deferred, they are not loaded for this)
+        if all(field in field_names for field in cls.counted_fields):
+            instance._counted = (instance.newsletter_id, instance.is_counted())
+        else:
+            instance._counted = models.DEFERRED
+        return instance
+
+    def is_counted(self):
+        return self.is_active
+
+    @classmethod
+    def recount_newsletters(cls, newsletters):
+        """
+        Counts again the subscribers of the newsletters (pks),
+        after bulk changes that don't go through save() or delete()
+        """
+        for newsletter in Newsletter.objects.filter(pk__in=newsletters):
+            newsletter.update_subscribers_count(test=cls.test)
+
+    def update_subscribers_count(self, deleted=False):
+        old = getattr(self, '_counted', None)
+        new = None if deleted else (self.newsletter_id, self.is_counted())
+        if old is models.DEFERRED:
+            newsletter = Newsletter.objects.filter(pk=self.newsletter_id).first()
+            if newsletter: newsletter.update_subscribers_count(test=self.test)
+        elif old != new:
+            field = 'test_subscribers_count' if self.test else 'subscribers_count'
+            if old and old[1]:
+                Newsletter.objects\
+                          .filter(pk=old[0])\
+                          .update(**{field: Greatest(F(field) - 1, 0)})
+            if new and new[1]:
+                Newsletter.objects\
+                          .filter(pk=new[0])\
+                          .update(**{field: F(field) + 1})
+        self._counted = new
+
+    def save(self, *args, **kwargs):
+        super(AbstractNewsletterSubscription, self).save(*args, **kwargs)
+        self.update_subscribers_count()
+
+    def delete(self, *args, **kwargs):
+        result = super(AbstractNewsletterSubscription, self).delete(*args, **kwargs)
+        self.update_subscribers_count(deleted=True)
+        return result
+
     def is_lockable_by(self, user):
         item = self.newsletter
         permission = check_user_permission_on_object(user=user, obj=item)
@@ -145,9 +256,52 @@ class AbstractNewsletterSubscription(ActivableModel, CreatedModifiedBy):
         return f'{self.newsletter} - {self.email}'
 
 
+SUBSCRIPTION_SUBSCRIBED = 'subscribed'
+SUBSCRIPTION_UNSUBSCRIBED = 'unsubscribed'
+SUBSCRIPTION_DISABLED = 'disabled'
+
+SUBSCRIPTION_STATUSES = (
+        (SUBSCRIPTION_SUBSCRIBED, _('Subscribed')),
+        (SUBSCRIPTION_UNSUBSCRIBED, _('Unsubscribed')),
+        (SUBSCRIPTION_DISABLED, _('Disabled')),
+    )
+
 class NewsletterSubscription(AbstractNewsletterSubscription):
     date_subscription = models.DateTimeField()
     date_unsubscription = models.DateTimeField(blank=True, null=True)
+    # computed on save from is_active and the subscription dates
+    status = models.CharField(max_length=16,
+                              choices=SUBSCRIPTION_STATUSES,
+                              default=SUBSCRIPTION_SUBSCRIBED,
+                              editable=False)
+
+    counted_fields = ('newsletter_id', 'status')
+
+    class Meta(AbstractNewsletterSubscription.Meta):
+        indexes = [
+            models.Index(fields=['newsletter', 'status']),
+            # case-insensitive lookups (admin search, import),
+            # the unique index starts with the newsletter
+            models.Index(Upper('email'), name='unicms_news_email_upper_idx'),
+        ]
+
+    def is_counted(self):
+        return self.status == SUBSCRIPTION_SUBSCRIBED
+
+    def get_status(self):
+        if not self.is_active: return SUBSCRIPTION_DISABLED
+        # never unsubscribed or subscribed again after unsubscription
+        if not self.date_unsubscription: return SUBSCRIPTION_SUBSCRIBED
+        if self.date_subscription > self.date_unsubscription:
+            return SUBSCRIPTION_SUBSCRIBED
+        return SUBSCRIPTION_UNSUBSCRIBED
+
+    def save(self, *args, **kwargs):
+        self.status = self.get_status()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['status']
+        super(NewsletterSubscription, self).save(*args, **kwargs)
 
     def token_is_valid(self, token):
         if not token: return False
@@ -167,7 +321,12 @@ class NewsletterSubscription(AbstractNewsletterSubscription):
 
 
 class NewsletterTestSubscription(AbstractNewsletterSubscription):
-    pass
+    test = True
+
+    class Meta(AbstractNewsletterSubscription.Meta):
+        indexes = [
+            models.Index(Upper('email'), name='unicms_news_test_email_up_idx'),
+        ]
 
 
 WEEK_DAYS = (
@@ -180,6 +339,61 @@ WEEK_DAYS = (
         ('6', _('Sunday')),
     )
 
+class SendingPlan(object):
+    """
+    Data and content of a message for a sending,
+    each one built at most once and only if needed
+    """
+
+    def __init__(self, message, test=False, data=None):
+        self.message = message
+        self.test = test
+        self._data = data or None
+        self._content = None
+        self._empty = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self.message.prepare_data(test=self.test)
+        return self._data
+
+    def is_empty(self):
+        # probed without preparing the data, that may be not needed
+        # if the content is cached
+        if self._empty is None:
+            self._empty = not self.message.has_content()
+        return self._empty
+
+    def render(self, test=None):
+        # the data does not depend on the test flag, only the template does
+        test = self.test if test is None else test
+        data = dict(self.data, test=test)
+        return (self.message.prepare_html(test=test, data=data),
+                self.message.prepare_plain_text(test=test, data=data))
+
+    def get_content(self):
+        """
+        Returns the html and plain text of the message,
+        cached by the hash of their sources
+        """
+        if self._content: return self._content
+        if not NEWSLETTER_CONTENT_CACHE_TIMEOUT:
+            self._content = self.render()
+            return self._content
+
+        # the test and the real content are rendered from the same data
+        # and cached together: a test send followed by the real one
+        # prepares the data and renders once
+        key = f'unicms_newsletter_content_{self.message.get_content_hash()}'
+        contents = cache.get(key)
+        if not contents:
+            contents = {test: self.render(test=test) for test in (False, True)}
+            cache.set(key, contents, NEWSLETTER_CONTENT_CACHE_TIMEOUT)
+        self._content = contents[self.test]
+        return self._content
+
+
 class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
     name = models.CharField(max_length=255)
     newsletter = models.ForeignKey(Newsletter, on_delete=models.CASCADE)
@@ -214,13 +428,33 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
     sending_test = models.BooleanField(default=False)
     queued = models.BooleanField(default=False)
     sending = models.BooleanField(default=False)
+    # sending leases: the process that holds the sending flag
+    # and the time it can be taken by another one, if not renewed
+    sending_owner = models.CharField(max_length=255, default='', blank=True)
+    sending_expires = models.DateTimeField(blank=True, null=True)
+    sending_test_owner = models.CharField(max_length=255, default='', blank=True)
+    sending_test_expires = models.DateTimeField(blank=True, null=True)
     week_day = models.CharField(max_length=255, default='', blank=True)
     discard_sent_news = models.BooleanField(default=False)
+    # when the message is due, computed from the fields above
+    # so that the cronjob selects the due messages with a single query
+    next_run_at = models.DateTimeField(blank=True, null=True,
+                                       editable=False, db_index=True)
+
+    # fields next_run_at depends on
+    schedule_fields = ('is_active', 'date_start', 'date_end',
+                       'repeat_each', 'week_day', 'hour')
 
     def save(self, *args, **kwargs):
         if '[' in self.week_day:
             self.week_day = self.week_day[1:-1].replace("'","").replace(" ","")
 
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(self.schedule_fields):
+            self.next_run_at = self.get_next_run()
+            if update_fields is not None:
+                kwargs['update_fields'] = list(update_fields) + ['next_run_at']
+
         if self.pk is None and self.banner:
             saved_banner = self.banner
             self.banner = None
@@ -238,6 +472,31 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
     def get_last_sending(self):
         return MessageSending.objects.filter(message=self).first()
 
+    def get_next_run(self):
+        last_sending = self.get_last_sending() if self.pk else None
+        return get_next_run(self,
+                            last_sending_date=last_sending.date if last_sending else None)
+
+    def update_next_run(self):
+        self.next_run_at = self.get_next_run()
+        Message.objects.filter(pk=self.pk).update(next_run_at=self.next_run_at)
+
+    def get_unfinished_sending(self):
+        return MessageSending.objects.filter(message=self, completed=False).first()
+
+    @classmethod
+    def get_due_messages(cls):
+        """
+        Messages queued or scheduled to be sent by now
+        and messages with an interrupted sending
+        """
+        unfinished = MessageSending.objects.filter(message=OuterRef('pk'),
+                                                   completed=False)
+        return cls.objects.filter(Q(queued=True) |
+                                  Q(next_run_at__lte=timezone.now()) |
+                                  Q(Exists(unfinished)),
+                                  newsletter__is_active=True)
+
     def is_in_progress(self):
         if not self.date_start or not self.date_end: return False
         now = timezone.localtime()
@@ -246,12 +505,22 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
     def is_ready(self, test=False):
         # if test message, check only test params
         if test:
-            if self.sending_test: return False
+            # test sendings are not resumed, an expired lease is free
+            if self.sending_test and \
+               self.sending_test_expires and \
+               self.sending_test_expires > timezone.now():
+                return False
             if self.queued_test: return True
             return False
 
-        # the message is being sent
-        if self.sending: return False
+        # the message is being sent, an expired lease is free
+        # (as the flags set without an expiry, before the leases)
+        if self.sending and \
+           self.sending_expires and \
+           self.sending_expires > timezone.now():
+            return False
+        # an interrupted sending is finished before a new one
+        if self.get_unfinished_sending(): return True
         # manual sending
         if self.queued: return True
         # check conditions
@@ -261,7 +530,7 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
         # check week day
         if self.week_day and str(now.weekday()) not in self.week_day.split(','):
             return False
-        # check hour: to work properly cronjob must be executed every hour
+        # check hour: to work properly cronjob must be executed at least every hour
         if self.hour is not None and now.hour != self.hour: return False
         # repeat_each rule
         # None: ignore it
@@ -278,13 +547,11 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
         categories = MessagePublicationCategory.objects\
                                           .filter(message=self, is_active=True)\
                                           .select_related('category')
-        if not categories.exists():
-            return Category.objects.all()
         cat_list = []
         for cat in categories:
             if cat.category not in cat_list:
                 cat_list.append(cat.category)
-        return cat_list
+        return cat_list or Category.objects.all()
 
     def get_calendar_contexts(self):
         return MessageCalendarContext.objects\
@@ -339,7 +606,10 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
                                         .filter(message=self,
                                                 is_active=True,
                                                 in_evidence=in_evidence)\
-                                        .select_related('publication')
+                                        .select_related('publication__publication__preview_image',
+                                                        'publication__publication__presentation_image',
+                                                        'publication__webpath__site')\
+                                        .prefetch_related('publication__publication__category')
         return mpub
 
     def get_calendar_events(self, calendar_context):
@@ -374,7 +644,8 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
                 # discard_sent_news_query = Q(date_start__gt=last_sending.date)
         return CalendarEvent.objects.filter(events_query,
                                             events_from_query,
-                                            events_to_query)
+                                            events_to_query)\
+                                    .select_related('event__publication')
                                             # discard_sent_news_query)
 
     def get_attachments(self):
@@ -382,13 +653,49 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
 
     @staticmethod
     def build_news_dict(d, news, category, taken_news=[]):
-        n = news.filter(publication__publication__category=category).exclude(publication__publication__pk__in=taken_news)
-        if n.exists():
+        # news is a list with prefetched categories
+        n = [pub for pub in news
+             if category in pub.publication.publication.category.all()
+             and pub.publication.publication.pk not in taken_news]
+        if n:
             for pub in n:
-                if pub.publication.pk not in taken_news:
-                    taken_news.append(pub.publication.publication.pk)
+                taken_news.append(pub.publication.publication.pk)
             d[category] = n
 
+    @staticmethod
+    def get_top_webpath_news(webpath_news, categories):
+        """
+        Returns the first NEWSLETTER_MAX_ITEMS_IN_CATEGORY webpath news
+        of every category, as a {category pk: [news]} dict.
+        If the database supports window functions, they are selected
+        in a single query with ROW_NUMBER() partitioned by category
+        """
+        if NEWSLETTER_WINDOW_FUNCTIONS and connection.features.supports_over_clause:
+            ordering = [OrderBy(F(field.lstrip('-')), descending=field.startswith('-'))
+                        for field in webpath_news.query.order_by]
+            top_news = {}
+            try:
+                news = webpath_news.filter(publication__category__in=categories)\
+                                   .annotate(news_category=F('publication__category'),
+                                             category_row=Window(expression=RowNumber(),
+                                                                 partition_by=[F('publication__category')],
+                                                                 order_by=ordering))\
+                                   .filter(category_row__lte=NEWSLETTER_MAX_ITEMS_IN_CATEGORY)
+                for pub in news:
+                    top_news.setdefault(pub.news_category, []).append(pub)
+                return top_news
+            except NotSupportedError: # pragma: no cover
+                # filters on window functions need Django 4.2
+                pass
+
+        top_news = {}
+        for pub in webpath_news:
+            for category in pub.publication.category.all():
+                items = top_news.setdefault(category.pk, [])
+                if len(items) < NEWSLETTER_MAX_ITEMS_IN_CATEGORY:
+                    items.append(pub)
+        return top_news
+
     def prepare_data(self, test=False):
         now = timezone.localtime()
 
@@ -403,6 +710,11 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
 
         for message_webpath in message_webpaths:
             webpath_news = webpath_news | self.get_webpath_news(message_webpath)
+        webpath_news = webpath_news.select_related('publication__preview_image',
+                                                   'publication__presentation_image',
+                                                   'webpath__site')\
+                                   .prefetch_related('publication__category')\
+                                   .order_by(*PublicationContext._meta.ordering, 'pk')
 
         for calendar in message_calendar_contexts:
             calendar_events[calendar] = self.get_calendar_events(calendar)
@@ -416,11 +728,15 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
             news_in_evidence = {}
             news_single = {}
 
+            # every list is fetched once and grouped in memory
+            evidence_news = list(evidence_news)
+            single_news = list(single_news)
+            top_webpath_news = Message.get_top_webpath_news(webpath_news, categories)
+
             taken_news = []
             for category in categories:
-                pubs = webpath_news.filter(publication__category=category)\
-                                   [0:NEWSLETTER_MAX_ITEMS_IN_CATEGORY]
-                if pubs.exists():
+                pubs = top_webpath_news.get(category.pk)
+                if pubs:
                     news_webpath[category] = pubs
 
                 Message.build_news_dict(news_in_evidence, evidence_news, category, taken_news)
@@ -454,14 +770,87 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
                 }
         return data
 
+    def has_content(self):
+        """
+        Tells if the message has something to send,
+        with at most one EXISTS query for each source
+        and without preparing its data
+        """
+        if self.content or self.intro_text: return True
+
+        if MessagePublication.objects.filter(message=self,
+                                             is_active=True).exists():
+            return True
+
+        # grouped news are shown only under a category
+        publication_contexts = MessagePublicationContext.objects\
+                                                        .filter(message=self,
+                                                                is_active=True)
+        if self.group_by_categories:
+            publication_contexts = publication_contexts.filter(publication__publication__category__isnull=False)
+        if publication_contexts.exists(): return True
+
+        now = timezone.localtime()
+        # news_from and news_to of every webpath, no limit if empty
+        news_from_query = Q(date_start__gte=Coalesce(OuterRef('news_from'),
+                                                     F('date_start')))
+        news_to_query = Q(date_start__lte=Coalesce(OuterRef('news_to'),
+                                                   F('date_start')))
+        webpath_news = PublicationContext.objects\
+                                         .filter(news_from_query,
+                                                 news_to_query,
+                                                 webpath=OuterRef('webpath'),
+                                                 date_start__lte=now,
+                                                 date_end__gt=now,
+                                                 is_active=True,
+                                                 publication__is_active=True)
+        if self.discard_sent_news:
+            last_sending = self.get_last_sending()
+            if last_sending:
+                webpath_news = webpath_news.filter(date_start__gt=last_sending.date)
+        if self.group_by_categories:
+            # the chosen categories or, if none, all of them
+            categories = MessagePublicationCategory.objects\
+                                                   .filter(message=self,
+                                                           is_active=True)\
+                                                   .values('category')
+            webpath_news = webpath_news.filter(Q(publication__category__in=categories) |
+                                               Q(~Exists(categories),
+                                                 publication__category__isnull=False))
+        if MessageWebpath.objects\
+                         .filter(message=self,
+                                 is_active=True,
+                                 webpath__is_active=True)\
+                         .filter(Exists(webpath_news))\
+                         .exists():
+            return True
+
+        events_from_query = Q(event__date_end__gte=Coalesce(OuterRef('events_from'),
+                                                            F('event__date_end')))
+        events_to_query = Q(event__date_start__lte=Coalesce(OuterRef('events_to'),
+                                                            F('event__date_start')))
+        calendar_events = CalendarEvent.objects\
+                                       .filter(events_from_query,
+                                               events_to_query,
+                                               calendar=OuterRef('calendar_context__calendar'),
+                                               event__date_end__gt=now,
+                                               is_active=True,
+                                               event__publication__is_active=True)
+        return MessageCalendarContext.objects\
+                                     .filter(message=self,
+                                             is_active=True,
+                                             calendar_context__is_active=True,
+                                             calendar_context__webpath__is_active=True,
+                                             calendar_context__calendar__is_active=True)\
+                                     .filter(Exists(calendar_events))\
+                                     .exists()
+
+    def get_sending_plan(self, test=False, data={}):
+        return SendingPlan(self, test=test, data=data)
+
     def check_data(self, test=False):
-        keys = ['content', 'intro_text', 'news_in_evidence',
-                'publications', 'single_news', 'webpath_news',
-                'calendar_events']
-        data = self.prepare_data(test=test)
-        for key in keys:
-            if data[key]: return data
-        return {}
+        plan = self.get_sending_plan(test=test)
+        return {} if plan.is_empty() else plan.data
 
     def prepare_plain_text(self, test=False, data={}):
         data = data or self.prepare_data(test=test)
@@ -472,7 +861,58 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
         html_content = get_template(self.template or DEFAULT_TEMPLATE)
         return html_content.render(data)
 
-    def register_sending(self, recipients, html_text):
+    def get_content_hash(self):
+        """
+        Hash of everything the rendered message depends on:
+        message fields, selected items, the content they refer to
+        and the template file
+        """
+        sources = [self.pk, self.modified, self.newsletter.modified]
+        selections = ((MessageWebpath, None),
+                      (MessagePublicationCategory, None),
+                      (MessagePublicationContext, 'publication__publication__modified'),
+                      (MessagePublication, 'publication__modified'),
+                      (MessageCalendarContext, None))
+        for model, content_modified in selections:
+            aggregates = [Count('pk'), Max('modified')]
+            if content_modified:
+                aggregates.append(Max(content_modified))
+            sources.append(model.objects\
+                                .filter(message=self)\
+                                .aggregate(*aggregates))
+        webpaths = MessageWebpath.objects\
+                                 .filter(message=self)\
+                                 .values('webpath')
+        sources.append(PublicationContext.objects\
+                                         .filter(webpath__in=webpaths)\
+                                         .aggregate(Count('pk'),
+                                                    Max('modified'),
+                                                    Max('publication__modified')))
+        calendars = MessageCalendarContext.objects\
+                                          .filter(message=self)\
+                                          .values('calendar_context__calendar')
+        sources.append(CalendarEvent.objects\
+                                    .filter(calendar__in=calendars)\
+                                    .aggregate(Count('pk'),
+                                               Max('pk'),
+                                               Max('event__publication__modified')))
+        sources.append(Category.objects.aggregate(Count('pk'), Max('modified')))
+        if self.discard_sent_news:
+            sources.append(self.get_last_sending())
+        template = get_template(self.template or DEFAULT_TEMPLATE)
+        origin = getattr(template, 'origin', None)
+        if origin and os.path.exists(str(origin.name)):
+            sources.append(os.path.getmtime(origin.name))
+        return hashlib.sha256(repr(sources).encode()).hexdigest()
+
+    def prepare_content(self, test=False, data={}):
+        """
+        Returns the html and plain text of the message,
+        cached by the hash of their sources
+        """
+        return self.get_sending_plan(test=test, data=data).get_content()
+
+    def register_sending(self, html_text):
         # create newsletter sending html file
         relative_path = message_html_path(self.newsletter.pk,
                                           self.pk)
@@ -488,56 +928,104 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
         html_file.write(html_text)
         html_file.close()
 
-        MessageSending.objects.create(message=self,
-                                      date=now,
-                                      html_file=f'{relative_path}/{file_name}',
-                                      recipients=len(recipients))
-
-    def send_message(self, recipient,
-                     html_text='', plain_text='',
-                     attachments=[],
-                     test=False):
-        # build message
+        with transaction.atomic():
+            sending = MessageSending.objects.create(message=self,
+                                                    date=now,
+                                                    html_file=f'{relative_path}/{file_name}',
+                                                    completed=False)
+            # from now on the message is resumed, never sent again
+            # from the start, even if this process is killed
+            self.dequeue()
+            # the next run follows this sending
+            self.update_next_run()
+        # without the queue, recipients are counted while sending
+        if NEWSLETTER_DELIVERY_QUEUE:
+            sending.recipients = sending.enqueue(self.newsletter.iter_subscribers())
+            sending.save(update_fields=['recipients'])
+        return sending
+
+    def build_message(self, recipient='',
+                      html_text='', plain_text='',
+                      attachments=[]):
         message = mail.EmailMessage(
             subject=self.name,
             # html_text if recipient.html else plain_text,
             body=html_text,
-            to=[recipient],
+            to=[recipient] if recipient else [],
             from_email=f'{self.newsletter.name} <{self.newsletter.sender_address or settings.DEFAULT_FROM_EMAIL}>',
         )
         message.content_subtype = "html"
 
         for attachment in attachments:
             message.attach_file(attachment)
+        return message
 
-        # end build message
+    def send_message(self, recipient,
+                     html_text='', plain_text='',
+                     attachments=[],
+                     test=False):
+        message = self.build_message(recipient=recipient,
+                                     html_text=html_text,
+                                     plain_text=plain_text,
+                                     attachments=attachments)
         message.send()
 
-
-    def send(self, test=False, data={}):
-        if test:
-            # the message is being sent
-            if self.sending_test:
-                raise Exception(_('The test message is being sent, try later'))
-            self.sending_test = True
+    def deliver(self, emails, on_result=None):
+        engine = get_delivery_engine()
+        return engine(label=self.newsletter).deliver(emails,
+                                                     on_result=on_result)
+
+    def deliver_sending(self, sending, prepared):
+        # results come from the engine workers,
+        # they are saved by this thread when it takes the next emails
+        results = []
+        lock = threading.Lock()
+        # subscribers without a result, to compute the checkpoint
+        pending = {}
+        last_subscriber = None
+
+        def on_result(recipient, error):
+            with lock:
+                results.append((recipient, error))
+
+        def save_results():
+            with lock:
+                done = results[:]
+                del results[:]
+            if not done: return
+            for email, error in done:
+                pending.pop(email, None)
+            checkpoint = min(pending.values()) - 1 if pending else last_subscriber
+            sending.checkpoint(done, last_subscriber=checkpoint)
+
+        def queued_emails():
+            while True:
+                batch = sending.claim_deliveries(NEWSLETTER_DELIVERY_BATCH)
+                if not batch: return
+                for email in batch:
+                    save_results()
+                    yield prepared.for_recipient(email)
+
+        def subscribers_emails():
+            nonlocal last_subscriber
+            recipients = self.newsletter\
+                             .iter_subscribers(after=sending.last_subscriber or 0)
+            for pk, email in recipients:
+                save_results()
+                pending[email] = pk
+                last_subscriber = pk
+                yield prepared.for_recipient(email)
+
+        if NEWSLETTER_DELIVERY_QUEUE:
+            emails = queued_emails()
         else:
-            # the message is being sent
-            if self.sending:
-                raise Exception(_('The message is being sent, try later'))
-            self.sending = True
+            emails = subscribers_emails()
+        report = self.deliver(self.keep_sending(emails), on_result=on_result)
+        save_results()
+        sending.complete()
+        return report
 
-        self.save()
-
-        logger.debug('[{}] sending message {} '
-                'for newsletter {}'.format(timezone.localtime(),
-                                           self.name,
-                                           self.newsletter))
-
-        data = data or self.prepare_data(test=test)
-        html_text = self.prepare_html(test=test, data=data)
-        plain_text = self.prepare_plain_text(test=test, data=data)
-
-        recipients = self.newsletter.get_valid_subscribers(test=test)
+    def prepare_email(self, html_text='', plain_text=''):
         attachments = self.get_attachments()
         message_attachments = []
         for attachment in attachments:
@@ -548,60 +1036,228 @@ class Message(ActivableModel, TimeStampedModel, CreatedModifiedBy):
                 logger.debug('[{}] newsletter attachment "{}"'
                             'not found'.format(timezone.localtime(),
                                                file_path))
-        # send message to recipients
-        for index, recipient in enumerate(recipients, start=1):
-
+        # encode body and attachments once
+        return PreparedEmail(self.build_message(html_text=html_text,
+                                                plain_text=plain_text,
+                                                attachments=message_attachments))
+
+    def resume(self, sending):
+        """
+        Sends an interrupted sending to the recipients
+        that have not received it yet
+        """
+        if not self.lock_sending():
+            raise Exception(_('The message is being sent, try later'))
+
+        logger.debug('[{}] resuming message {} '
+                'for newsletter {} from {}'.format(timezone.localtime(),
+                                                   self.name,
+                                                   self.newsletter,
+                                                   sending.date))
+
+        try:
+            with self.hold_sending():
+                report = self.continue_sending(sending)
+        finally:
+            # an incomplete sending is resumed again
+            self.unlock_sending()
+
+        logger.debug('[{}] resumed message {} '
+                'for newsletter {}: {}'.format(timezone.localtime(),
+                                               self.name,
+                                               self.newsletter,
+                                               report))
+
+    def continue_sending(self, sending):
+        """
+        Delivers an interrupted sending to the recipients
+        that have not received it yet, the lease must be held
+        """
+        # same content of the first part of the sending
+        html_text = sending.get_html() or self.prepare_html()
+        prepared = self.prepare_email(html_text=html_text)
+        if NEWSLETTER_DELIVERY_QUEUE:
+            sending.requeue(self.newsletter.iter_subscribers())
+        return self.deliver_sending(sending, prepared)
+
+    def lock_sending(self, test=False):
+        """
+        Takes the sending lease with a single conditional UPDATE,
+        if it is free or expired, so that only one process gets the message.
+        A flag without an expiry, set before the leases, is expired
+        """
+        flag = 'sending_test' if test else 'sending'
+        owner = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        now = timezone.now()
+        expires = now + datetime.timedelta(seconds=NEWSLETTER_SENDING_LEASE)
+        locked = Message.objects\
+                        .filter(Q(**{flag: False}) |
+                                Q(**{f'{flag}_expires__lt': now}) |
+                                Q(**{f'{flag}_expires__isnull': True}),
+                                pk=self.pk)\
+                        .update(**{flag: True,
+                                   f'{flag}_owner': owner,
+                                   f'{flag}_expires': expires})
+        if not locked: return False
+        setattr(self, flag, True)
+        setattr(self, f'{flag}_owner', owner)
+        setattr(self, f'{flag}_expires', expires)
+        return True
+
+    def renew_sending(self, test=False):
+        """
+        Extends the sending lease,
+        fails if it has been taken by another process
+        """
+        flag = 'sending_test' if test else 'sending'
+        expires = timezone.now() + datetime.timedelta(seconds=NEWSLETTER_SENDING_LEASE)
+        renewed = Message.objects\
+                         .filter(pk=self.pk,
+                                 **{f'{flag}_owner': getattr(self, f'{flag}_owner')})\
+                         .update(**{f'{flag}_expires': expires})
+        if not renewed:
+            raise Exception(_('The message is being sent by another process'))
+        setattr(self, f'{flag}_expires', expires)
+
+    def unlock_sending(self, test=False):
+        """
+        Releases the sending lease
+        """
+        flag = 'sending_test' if test else 'sending'
+        values = {flag: False,
+                  f'{flag}_owner': '',
+                  f'{flag}_expires': None}
+        Message.objects\
+               .filter(pk=self.pk,
+                       **{f'{flag}_owner': getattr(self, f'{flag}_owner')})\
+               .update(**values)
+        for field, value in values.items():
+            setattr(self, field, value)
+
+    def dequeue(self, test=False):
+        queued = 'queued_test' if test else 'queued'
+        setattr(self, queued, False)
+        Message.objects.filter(pk=self.pk).update(**{queued: False})
+
+    @contextlib.contextmanager
+    def hold_sending(self, test=False):
+        """
+        Heartbeat of the sending process: a thread renews the lease
+        every third of its duration, even while the engine
+        is sleeping in a throttled chunk.
+        The thread has its own connection, that can not see a lease
+        taken in a transaction not committed yet: in a transaction
+        (e.g. the admin change form) the lease is not renewed
+        """
+        self._lease_error = None
+        if connection.in_atomic_block:
+            logger.warning(f'[{self.newsletter}] {self.name}: sent in a transaction, '
+                           f'the sending lease expires in {NEWSLETTER_SENDING_LEASE}s')
+            yield
+            return
+
+        stop = threading.Event()
+
+        def heartbeat():
             try:
-                logger.debug(f'Try to send newsletter {self.newsletter} email to {recipient.email}')
-
-                if NEWSLETTER_SEND_EMAIL_DELAY:
-                    logger.debug(f'Start sleeping {self.newsletter} - SEND EMAIL DELAY')
-                    time.sleep(NEWSLETTER_SEND_EMAIL_DELAY)
-                    logger.debug(f'End sleeping {self.newsletter} - SEND EMAIL DELAY')
-                if NEWSLETTER_SEND_EMAIL_GROUP:
-                    if index % NEWSLETTER_SEND_EMAIL_GROUP == 0:
-                        logger.debug(f'Start sleeping {self.newsletter} - SEND EMAIL GROUP')
-                        time.sleep(NEWSLETTER_SEND_EMAIL_GROUP_DELAY)
-                        logger.debug(f'End sleeping {self.newsletter} - SEND EMAIL GROUP')
-
-                self.send_message(test=test,
-                                  recipient=recipient.email,
-                                  html_text=html_text,
-                                  plain_text=plain_text,
-                                  attachments=message_attachments)
-
-                logger.debug(f'Sent newsletter {self.newsletter} email to {recipient.email}')
-
-            except Exception as e:
-                logger.debug(f'Newsletter {self.newsletter} exception {e} while sending to {recipient.email}')
+                while not stop.wait(NEWSLETTER_SENDING_LEASE / 3):
+                    try:
+                        self.renew_sending(test=test)
+                    except DatabaseError as e:
+                        # e.g. a lost connection or a locked database,
+                        # retried at the next beat
+                        logger.warning(f'[{self.newsletter}] {self.name}: '
+                                       f'sending lease not renewed: {e}')
+                        connection.close()
+                    except Exception as e:
+                        # the lease has been taken by another process
+                        logger.error(f'[{self.newsletter}] {self.name}: {e}')
+                        self._lease_error = e
+                        return
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def keep_sending(self, emails, test=False):
+        """
+        Stops the sending, when the engine takes the next email,
+        if the lease has been lost
+        """
+        for email in emails:
+            if getattr(self, '_lease_error', None):
+                raise self._lease_error
+            yield email
+
+    def send(self, test=False, data={}, plan=None):
+        # the plan already built by the caller, if any,
+        # so that the data is never prepared twice
+        plan = plan or self.get_sending_plan(test=test, data=data)
+        if not self.lock_sending(test=test):
+            # the message is being sent
+            if test:
+                raise Exception(_('The test message is being sent, try later'))
+            raise Exception(_('The message is being sent, try later'))
 
-        logger.debug('[{}] sent {} message {} '
+        logger.debug('[{}] sending message {} '
                 'for newsletter {}'.format(timezone.localtime(),
-                                           'test-' if test else '',
                                            self.name,
                                            self.newsletter))
 
-        if test:
-            self.sending_test = False
-            self.queued_test = False
-        else:
-            self.queued = False
-            self.sending = False
-            self.register_sending(recipients, html_text)
-        self.save()
+        # a message that fails before reaching any recipient
+        # stays queued, otherwise the sending is resumed
+        try:
+            with self.hold_sending(test=test):
+                sending = None if test else self.get_unfinished_sending()
+                if sending:
+                    # the interrupted sending is finished first,
+                    # a new one starts when the message is due again
+                    report = self.continue_sending(sending)
+                else:
+                    html_text, plain_text = plan.get_content()
+
+                    prepared = self.prepare_email(html_text=html_text,
+                                                  plain_text=plain_text)
+                    # send message to recipients
+                    if test:
+                        recipients = self.newsletter.iter_subscribers(test=True)
+                        emails = (prepared.for_recipient(email)
+                                  for pk, email in recipients)
+                        self.dequeue(test=True)
+                        report = self.deliver(self.keep_sending(emails, test=True))
+                    else:
+                        # dequeued with the creation of the sending
+                        sending = self.register_sending(html_text)
+                        report = self.deliver_sending(sending, prepared)
+        finally:
+            self.unlock_sending(test=test)
+
+        logger.debug('[{}] sent {} message {} '
+                'for newsletter {}: {}'.format(timezone.localtime(),
+                                               'test-' if test else '',
+                                               self.name,
+                                               self.newsletter,
+                                               report))
 
     def start_sending(self, test=False):
         # Start sending process
         # It decides whether the message should be sent instantly
         # or if it should be queued
-        subscribers = self.newsletter.get_valid_subscribers(test=test)
-        if len(subscribers) <= NEWSLETTER_MAX_ITEMS_FOR_MANUAL_SENDING:
+        subscribers = self.newsletter.get_subscribers_count(test=test)
+        if subscribers <= NEWSLETTER_MAX_ITEMS_FOR_MANUAL_SENDING:
             self.send(test=test)
             return _("Test message sent") if test else _("Message sent")
         else:
-            if test: self.queued_test = True
-            else: self.queued = True
-            self.save()
+            # the sending flags are not overwritten
+            queued = 'queued_test' if test else 'queued'
+            setattr(self, queued, True)
+            Message.objects.filter(pk=self.pk).update(**{queued: True})
             return _("Test message queued for the next submission") \
                      if test \
                      else _("Message queued for the next submission")
@@ -727,12 +1383,124 @@ class MessageSending(TimeStampedModel):
     date = models.DateTimeField()
     html_file = models.FileField(blank=True, null=True)
     recipients = models.IntegerField(default=0)
-    # success = models.IntegerField(default=0)
-    # failed = models.IntegerField(default=0)
+    success = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    completed = models.BooleanField(default=True)
+    # checkpoint: all the subscribers up to this pk have been processed
+    last_subscriber = models.PositiveIntegerField(blank=True, null=True)
 
     class Meta:
         ordering = ['-date',]
 
+    def get_html(self):
+        if not self.html_file: return ''
+        try:
+            with self.html_file.open('rb') as html_file:
+                return html_file.read().decode('utf-8')
+        except OSError:
+            logger.warning(f'[{self.message.newsletter}] sending html file '
+                           f'{self.html_file} not found')
+            return ''
+
+    def enqueue(self, subscribers, ignore_conflicts=False):
+        """
+        Fills the delivery queue with (pk, email) subscribers,
+        returns the number of queued recipients
+        """
+        queued = 0
+        for batch in chunks(subscribers, NEWSLETTER_DELIVERY_BATCH):
+            MessageDelivery.objects.bulk_create(
+                (MessageDelivery(sending=self,
+                                 subscriber_id=pk,
+                                 email=email)
+                 for pk, email in batch),
+                ignore_conflicts=ignore_conflicts)
+            queued += len(batch)
+        return queued
+
+    def requeue(self, subscribers):
+        """
+        Puts back in the queue the interrupted deliveries,
+        the failed ones with attempts left and the subscribers
+        not queued yet (if the sending stopped while enqueuing)
+        """
+        deliveries = MessageDelivery.objects.filter(sending=self)
+        deliveries.filter(status=DELIVERY_SENDING)\
+                  .update(status=DELIVERY_PENDING)
+        retry = deliveries.filter(status=DELIVERY_FAILED,
+                                  attempts__lt=NEWSLETTER_DELIVERY_MAX_ATTEMPTS)\
+                          .update(status=DELIVERY_PENDING)
+        self.enqueue(subscribers, ignore_conflicts=True)
+        MessageSending.objects\
+                      .filter(pk=self.pk)\
+                      .update(recipients=deliveries.count(),
+                              failed=F('failed') - retry)
+
+    def complete(self):
+        fields = {'completed': True}
+        # without the queue the recipients are the processed subscribers
+        if not NEWSLETTER_DELIVERY_QUEUE:
+            fields['recipients'] = F('success') + F('failed')
+        MessageSending.objects.filter(pk=self.pk).update(**fields)
+        self.completed = True
+
+    def checkpoint(self, results, last_subscriber=None):
+        """
+        Saves a list of (email, error) delivery results
+        and the sending progress
+        """
+        if NEWSLETTER_DELIVERY_QUEUE:
+            self.save_results(results)
+        failed = len([error for email, error in results if error])
+        fields = {'success': F('success') + len(results) - failed,
+                  'failed': F('failed') + failed}
+        if last_subscriber is not None:
+            fields['last_subscriber'] = last_subscriber
+        MessageSending.objects.filter(pk=self.pk).update(**fields)
+
+    def claim_deliveries(self, size):
+        """
+        Takes `size` pending deliveries, skipping the ones locked
+        by other workers, and returns their email addresses
+        """
+        with transaction.atomic():
+            batch = list(MessageDelivery.objects\
+                                        .select_for_update(skip_locked=True)\
+                                        .filter(sending=self,
+                                                status=DELIVERY_PENDING)\
+                                        .order_by('pk')\
+                                        .values_list('pk', 'email')[:size])
+            MessageDelivery.objects\
+                           .filter(pk__in=[pk for pk, email in batch])\
+                           .update(status=DELIVERY_SENDING,
+                                   attempts=F('attempts') + 1,
+                                   modified=timezone.now())
+        return [email for pk, email in batch]
+
+    def save_results(self, results):
+        """
+        Saves a list of (email, error) results in the delivery queue
+        """
+        if not results: return
+        now = timezone.now()
+        sent = [email for email, error in results if not error]
+        deliveries = MessageDelivery.objects.filter(sending=self)
+        if sent:
+            deliveries.filter(email__in=sent)\
+                      .update(status=DELIVERY_SENT,
+                              last_error='',
+                              date_sent=now,
+                              modified=now)
+        # usually many recipients fail with the same error
+        failed = {}
+        for email, error in results:
+            if error: failed.setdefault(error, []).append(email)
+        for error, emails in failed.items():
+            deliveries.filter(email__in=emails)\
+                      .update(status=DELIVERY_FAILED,
+                              last_error=error,
+                              modified=now)
+
     def view_html(self):
         newsletter = self.message.newsletter
         path = f'//{newsletter.site.domain}/{CMS_NEWSLETTER_VIEW_PREFIX_PATH}/{newsletter.slug}/{CMS_NEWSLETTER_MESSAGE_SUB_PATH}/{self.message.pk}/{CMS_NEWSLETTER_MESSAGE_SENDING_SUB_PATH}/{self.pk}/'
@@ -740,3 +1508,59 @@ class MessageSending(TimeStampedModel):
 
     def __str__(self):
         return f'{self.message} - {self.date}'
+
+
+DELIVERY_PENDING = 'pending'
+DELIVERY_SENDING = 'sending'
+DELIVERY_SENT = 'sent'
+DELIVERY_FAILED = 'failed'
+
+DELIVERY_STATUSES = (
+        (DELIVERY_PENDING, _('Pending')),
+        (DELIVERY_SENDING, _('Sending')),
+        (DELIVERY_SENT, _('Sent')),
+        (DELIVERY_FAILED, _('Failed')),
+    )
+
+class MessageDelivery(TimeStampedModel):
+    sending = models.ForeignKey(MessageSending, on_delete=models.CASCADE)
+    subscriber = models.ForeignKey(NewsletterSubscription,
+                                   on_delete=models.SET_NULL,
+                                   blank=True, null=True)
+    email = models.EmailField()
+    status = models.CharField(max_length=16,
+                              choices=DELIVERY_STATUSES,
+                              default=DELIVERY_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(default='', blank=True)
+    date_sent = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['pk']
+        unique_together = ('sending', 'email')
+        indexes = [
+            models.Index(fields=['sending', 'status']),
+        ]
+        verbose_name_plural = _("Message deliveries")
+
+    @classmethod
+    def purge(cls, days=NEWSLETTER_DELIVERY_RETENTION,
+              size=NEWSLETTER_DELIVERY_BATCH):
+        """
+        Deletes the deliveries of the completed sendings
+        older than `days`, `size` rows at a time.
+        Returns the number of deleted deliveries
+        """
+        if not days: return 0
+        limit = timezone.now() - datetime.timedelta(days=days)
+        deliveries = cls.objects.filter(sending__completed=True,
+                                        sending__date__lt=limit)\
+                                .values_list('pk', flat=True)
+        deleted = 0
+        while True:
+            batch = list(deliveries[:size])
+            if not batch: return deleted
+            deleted += cls.objects.filter(pk__in=batch).delete()[0]
+
+    def __str__(self):
+        return f'{self.sending} - {self.email}'
@@ -0,0 +1,53 @@
+import datetime
+
+from django.utils import timezone
+
+
+def get_next_run(message, last_sending_date=None, now=None):
+    """
+    First time, from the current hour on, the message is due
+    according to date_start, date_end, week_day, hour and repeat_each
+    (None if it is not going to be sent anymore).
+    Migration 0072 has a frozen copy of it
+    """
+    if not message.is_active: return None
+    if not message.date_start or not message.date_end: return None
+
+    now = timezone.localtime(now)
+    # the cronjob sends a message at most once an hour
+    start = max(timezone.localtime(message.date_start),
+                now.replace(minute=0, second=0, microsecond=0))
+    if last_sending_date:
+        last_sending_date = timezone.localtime(last_sending_date)
+        # repeat_each rule
+        # None: ignore it
+        # 0: only 1 send
+        # n: every n days
+        if message.repeat_each == 0: return None
+        if message.repeat_each:
+            start = max(start,
+                        last_sending_date + datetime.timedelta(message.repeat_each))
+        else:
+            start = max(start,
+                        last_sending_date.replace(minute=0, second=0, microsecond=0) +
+                        datetime.timedelta(hours=1))
+
+    week_days = message.week_day.split(',') if message.week_day else []
+    next_run = start
+    # a day of the week, at the chosen hour, is found in 8 days
+    for day in range(8):
+        if not week_days or str(next_run.weekday()) in week_days:
+            if message.hour is None or next_run.hour == message.hour:
+                break
+            if next_run.hour < message.hour:
+                next_run = next_run.replace(hour=message.hour,
+                                            minute=0, second=0, microsecond=0)
+                break
+        next_run = (next_run + datetime.timedelta(days=1)).replace(hour=0, minute=0,
+                                                                  second=0, microsecond=0)
+    else:
+        return None
+
+    # a run in the current hour is due now
+    if max(next_run, now) >= message.date_end: return None
+    return next_run
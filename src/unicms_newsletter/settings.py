@@ -26,11 +26,67 @@ NEWSLETTER_MAX_ITEMS_FOR_MANUAL_SENDING = 20
 
 NEWSLETTER_MAX_ITEMS_IN_CATEGORY = 5
 NEWSLETTER_MAX_FREE_ITEMS = 15
+# select the top news of every category with a window function,
+# if the database supports it (otherwise they are selected in python)
+NEWSLETTER_WINDOW_FUNCTIONS = True
 
+# max emails sent, for all the workers (0: unlimited)
+NEWSLETTER_SEND_RATE_PER_SECOND = 0
+NEWSLETTER_SEND_RATE_PER_HOUR = 0
+# share the rate between processes through a locked file,
+# e.g. '/tmp/unicms_newsletter_rate.json' (empty: only between threads,
+# every process of unicms_newsletter_send --workers has its own rate).
+# With NEWSLETTER_SEND_RATE_PER_HOUR the hourly quota must outlive
+# the command, that runs every minute: if empty, the file
+# unicms_newsletter_rate.json of the temporary directory is used
+NEWSLETTER_SEND_RATE_FILE = ''
+
+# deprecated, used as target rates if no NEWSLETTER_SEND_RATE_* is set
 NEWSLETTER_SEND_EMAIL_GROUP = 10
 NEWSLETTER_SEND_EMAIL_GROUP_DELAY = 5
 NEWSLETTER_SEND_EMAIL_DELAY = 0
 
+# emails sent over the same connection before logging the throughput
+NEWSLETTER_SEND_EMAIL_CHUNK = 100
+# reopen the connection every n emails (0: never)
+NEWSLETTER_SEND_EMAIL_RECONNECT = 1000
+
+# unicms_newsletter.delivery.SequentialDelivery: one connection
+# unicms_newsletter.delivery.ThreadedDelivery: a pool of connections
+# unicms_newsletter.delivery.AsyncDelivery: concurrent sessions on an
+#   event loop, requires aiosmtplib
+NEWSLETTER_DELIVERY_ENGINE = 'unicms_newsletter.delivery.SequentialDelivery'
+# threads (ThreadedDelivery) or SMTP sessions (AsyncDelivery)
+NEWSLETTER_DELIVERY_WORKERS = 4
+NEWSLETTER_DELIVERY_MAX_WORKERS = 16
+
+# keep track of every recipient of a sending (MessageDelivery)
+NEWSLETTER_DELIVERY_QUEUE = True
+# recipients taken from the queue in a single transaction
+NEWSLETTER_DELIVERY_BATCH = 500
+# subscriptions written in a single transaction by the bulk import
+NEWSLETTER_IMPORT_BATCH = 1000
+# subscriptions fetched at a time by the streaming export
+NEWSLETTER_EXPORT_BATCH = 2000
+# failed deliveries are retried when a sending is resumed
+NEWSLETTER_DELIVERY_MAX_ATTEMPTS = 3
+# days the deliveries of the completed sendings are kept,
+# see unicms_newsletter_purge_deliveries (0: forever)
+NEWSLETTER_DELIVERY_RETENTION = 90
+# seconds, renewed while sending: if the sending process dies
+# the message can be taken by another one when the lease expires
+NEWSLETTER_SENDING_LEASE = 300
+
 DEFAULT_TEMPLATE = 'newsletter/body.html'
+# seconds a rendered message is cached, by the hash of its sources (0: no cache)
+NEWSLETTER_CONTENT_CACHE_TIMEOUT = 300
 
 TOKEN_EXPIRATION = 30 # days
+
+# encodes the data of the subscription confirmation links
+# unicms_newsletter.tokens.JWETokenCodec: RSA encrypted JWE,
+#   requires settings.JWE_RSA_KEY_PATH, JWE_ALG and JWE_ENC
+# unicms_newsletter.tokens.SignedTokenCodec: shorter links, signed
+#   with settings.SECRET_KEY, the data is readable but can't be changed
+# links already sent as JWE are accepted by every codec
+NEWSLETTER_TOKEN_CODEC = 'unicms_newsletter.tokens.JWETokenCodec'
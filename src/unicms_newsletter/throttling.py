@@ -0,0 +1,166 @@
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover
+    fcntl = None
+
+from django.conf import settings
+
+from . settings import *
+
+
+logger = logging.getLogger(__name__)
+
+
+NEWSLETTER_SEND_RATE_PER_SECOND = getattr(settings, 'NEWSLETTER_SEND_RATE_PER_SECOND',
+                                          NEWSLETTER_SEND_RATE_PER_SECOND)
+NEWSLETTER_SEND_RATE_PER_HOUR = getattr(settings, 'NEWSLETTER_SEND_RATE_PER_HOUR',
+                                        NEWSLETTER_SEND_RATE_PER_HOUR)
+NEWSLETTER_SEND_RATE_FILE = getattr(settings, 'NEWSLETTER_SEND_RATE_FILE',
+                                    NEWSLETTER_SEND_RATE_FILE)
+NEWSLETTER_SEND_EMAIL_DELAY = getattr(settings, 'NEWSLETTER_SEND_EMAIL_DELAY',
+                                      NEWSLETTER_SEND_EMAIL_DELAY)
+NEWSLETTER_SEND_EMAIL_GROUP = getattr(settings, 'NEWSLETTER_SEND_EMAIL_GROUP',
+                                      NEWSLETTER_SEND_EMAIL_GROUP)
+NEWSLETTER_SEND_EMAIL_GROUP_DELAY = getattr(settings, 'NEWSLETTER_SEND_EMAIL_GROUP_DELAY',
+                                            NEWSLETTER_SEND_EMAIL_GROUP_DELAY)
+
+
+class MemoryStore(object):
+    """
+    Buckets state shared between the threads of a process
+    """
+
+    def __init__(self):
+        self.state = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.lock:
+            yield self.state
+
+
+class FileStore(object):
+    """
+    Buckets state saved in a JSON file, guarded by an exclusive
+    file lock, shared between all the processes of a node
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.lock, open(self.path, 'a+', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                try:
+                    state = json.loads(content) if content else {}
+                except ValueError:
+                    logger.warning(f'Invalid rate limit file {self.path}, reset')
+                    state = {}
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class TokenBucketLimiter(object):
+    """
+    Token bucket rate limiter.
+    Every bucket is a (name, rate in tokens per second, capacity) tuple,
+    each email takes a token from all of them.
+    A token taken in advance is a booked slot: reserve() returns
+    the seconds to wait for it, so the send time is not added
+    on top of the configured rate
+    """
+
+    def __init__(self, buckets, store):
+        self.buckets = buckets
+        self.store = store
+
+    def reserve(self):
+        delay = 0
+        with self.store.transaction() as state:
+            now = time.time()
+            for name, rate, capacity in self.buckets:
+                tokens, timestamp = state.get(name, (capacity, now))
+                tokens = min(capacity, tokens + (now - timestamp) * rate) - 1
+                state[name] = (tokens, now)
+                if tokens < 0:
+                    delay = max(delay, -tokens / rate)
+        return delay
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+_memory_store = MemoryStore()
+
+
+def get_buckets():
+    buckets = []
+    if NEWSLETTER_SEND_RATE_PER_SECOND:
+        buckets.append(('second',
+                        NEWSLETTER_SEND_RATE_PER_SECOND,
+                        NEWSLETTER_SEND_RATE_PER_SECOND))
+    if NEWSLETTER_SEND_RATE_PER_HOUR:
+        buckets.append(('hour',
+                        NEWSLETTER_SEND_RATE_PER_HOUR / 3600,
+                        NEWSLETTER_SEND_RATE_PER_HOUR))
+    if buckets: return buckets
+
+    # deprecated settings, as the equivalent target rates
+    if NEWSLETTER_SEND_EMAIL_DELAY:
+        buckets.append(('delay', 1 / NEWSLETTER_SEND_EMAIL_DELAY, 1))
+    if NEWSLETTER_SEND_EMAIL_GROUP and NEWSLETTER_SEND_EMAIL_GROUP_DELAY:
+        buckets.append(('group',
+                        NEWSLETTER_SEND_EMAIL_GROUP / NEWSLETTER_SEND_EMAIL_GROUP_DELAY,
+                        NEWSLETTER_SEND_EMAIL_GROUP))
+    return buckets
+
+
+def get_rate_file():
+    """
+    File of the buckets state shared between processes,
+    empty if it is kept in memory
+    """
+    if NEWSLETTER_SEND_RATE_FILE: return NEWSLETTER_SEND_RATE_FILE
+    # a full hourly bucket in every new process
+    # would send the whole quota at every run
+    if NEWSLETTER_SEND_RATE_PER_HOUR and fcntl:
+        return os.path.join(tempfile.gettempdir(), 'unicms_newsletter_rate.json')
+    return ''
+
+
+def get_rate_limiter():
+    """
+    Returns the limiter configured in settings, None if unlimited
+    """
+    buckets = get_buckets()
+    if not buckets: return None
+    rate_file = get_rate_file()
+    if rate_file:
+        store = FileStore(rate_file)
+    else:
+        if NEWSLETTER_SEND_RATE_PER_HOUR: # pragma: no cover
+            logger.warning('File locks are not available, '
+                           'the hourly send rate is enforced per process')
+        store = _memory_store
+    return TokenBucketLimiter(buckets, store)
@@ -0,0 +1,72 @@
+import datetime
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+
+from . settings import *
+
+
+NEWSLETTER_TOKEN_CODEC = getattr(settings, 'NEWSLETTER_TOKEN_CODEC',
+                                 NEWSLETTER_TOKEN_CODEC)
+TOKEN_EXPIRATION = getattr(settings, 'TOKEN_EXPIRATION', TOKEN_EXPIRATION)
+
+
+class JWETokenCodec(object):
+    """
+    RSA-OAEP encrypted JWE (settings.JWE_*), see jwts.py
+    """
+
+    @staticmethod
+    def is_token(token):
+        # JWE compact serialization: five base64url parts
+        return token.count('.') == 4 and ':' not in token
+
+    def encode(self, data):
+        # jwts needs the JWE settings, only if this codec is used
+        from . jwts import encrypt_to_jwe
+        return encrypt_to_jwe(json.dumps(data).encode())
+
+    def decode(self, token):
+        from . jwts import decrypt_from_jwe
+        return json.loads(decrypt_from_jwe(token))
+
+
+class SignedTokenCodec(object):
+    """
+    Compressed JSON signed with HMAC (django.core.signing),
+    expiring after TOKEN_EXPIRATION days.
+    Much shorter and faster than JWE: the data can't be changed
+    but is not encrypted
+    """
+    salt = 'unicms_newsletter.tokens'
+
+    def encode(self, data):
+        return signing.dumps(data, salt=self.salt, compress=True)
+
+    def decode(self, token):
+        try:
+            return signing.loads(token, salt=self.salt,
+                                 max_age=datetime.timedelta(days=TOKEN_EXPIRATION))
+        except signing.SignatureExpired:
+            raise Exception(_("Token is expired"))
+        except signing.BadSignature:
+            raise Exception(_("Invalid token"))
+
+
+def get_token_codec():
+    return import_string(NEWSLETTER_TOKEN_CODEC)()
+
+
+def encode_token(data):
+    return get_token_codec().encode(data)
+
+
+def decode_token(token):
+    codec = get_token_codec()
+    # links sent before switching from JWE to another codec
+    if not isinstance(codec, JWETokenCodec) and JWETokenCodec.is_token(token):
+        codec = JWETokenCodec()
+    return codec.decode(token)
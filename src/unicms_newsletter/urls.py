@@ -32,6 +32,8 @@ nsub = f'{newsletter_prefix}/<int:newsletter_id>/subscriptions'
 urlpatterns += path(f'{nsub}/', newsletter.NewsletterSubscriptionList.as_view(), name='newsletter-subscriptions'),
 urlpatterns += path(f'{nsub}/<int:pk>/', newsletter.NewsletterSubscriptionView.as_view(), name='newsletter-subscription'),
 urlpatterns += path(f'{nsub}/form/', newsletter.NewsletterSubscriptionFormView.as_view(), name='newsletter-subscription-form'),
+urlpatterns += path(f'{nsub}/export/', newsletter.NewsletterSubscriptionExportView.as_view(), name='newsletter-subscriptions-export'),
+urlpatterns += path(f'{nsub}/import/', newsletter.NewsletterSubscriptionImportView.as_view(), name='newsletter-subscriptions-import'),
 
 # test subscriptions
 ntsub = f'{newsletter_prefix}/<int:newsletter_id>/test-subscriptions'
@@ -1,5 +1,4 @@
 import datetime
-import json
 import logging
 
 from django import template
@@ -14,7 +13,7 @@ from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from . forms import *
-from . jwts import *
+from . tokens import decode_token, encode_token
 from . models import *
 from . settings import DEFAULT_TEMPLATE
 
@@ -102,9 +101,9 @@ def subscribe_unsubscribe(request):
                         'html': html,
                         'newsletter': newsletter.pk,
                         'timestamp': timezone.now().timestamp() }
-                encrypted_data = encrypt_to_jwe(json.dumps(data).encode())
+                token = encode_token(data)
 
-                url =  request.build_absolute_uri(f'{sub_url}?d={encrypted_data}')
+                url =  request.build_absolute_uri(f'{sub_url}?d={token}')
                 email_body = _('Click on the following URL to confirm your choice: {}').format(url)
 
                 # send email with token to confirm action
@@ -141,7 +140,7 @@ def subscription_confirm(request):
                     'with empty data'.format(timezone.localtime()))
         raise Exception(_("No data submitted"))
 
-    data_dict = json.loads(decrypt_from_jwe(data))
+    data_dict = decode_token(data)
     newsletter = get_object_or_404(Newsletter,
                                    is_active=True,
                                    pk=data_dict['newsletter'])
@@ -210,7 +209,7 @@ def unsubscription_confirm(request):
                     'with empty data'.format(timezone.localtime()))
         raise Exception(_("No data submitted"))
 
-    data_dict = json.loads(decrypt_from_jwe(data))
+    data_dict = decode_token(data)
     newsletter = get_object_or_404(Newsletter,
                                    is_active=True,
                                    pk=data_dict['newsletter'])